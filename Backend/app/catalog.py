@@ -0,0 +1,51 @@
+# app/catalog.py
+import os
+from typing import Dict, Iterable, Iterator, List, Tuple, TypeVar
+from app.config import settings
+from app.schemas import Course, JD
+
+DATA_DIR = settings.DATA_DIR
+
+T = TypeVar("T")
+
+def iter_courses(path: str = None) -> Iterator[Course]:
+    with open(path or os.path.join(DATA_DIR, "courses.jsonl")) as f:
+        for line in f:
+            if line.strip():
+                yield Course.model_validate_json(line)
+
+def iter_jds(path: str = None) -> Iterator[JD]:
+    with open(path or os.path.join(DATA_DIR, "jds.jsonl")) as f:
+        for line in f:
+            if line.strip():
+                yield JD.model_validate_json(line)
+
+def load_courses(path: str = None) -> Dict[str, Course]:
+    return {c.course_id: c for c in iter_courses(path)}
+
+def load_jds(path: str = None) -> Dict[str, JD]:
+    return {j.role: j for j in iter_jds(path)}
+
+def course_doc(c: Course) -> Dict:
+    txt = f"{c.title}. Skills: {', '.join(c.skills)}. Outcomes: {', '.join(c.outcomes)}. Diff: {c.difficulty}"
+    return {"text": txt, "meta": {"source_id": c.course_id, "kind":"course", "span":"skills"}}
+
+def jd_doc(j: JD) -> Dict:
+    txt = f"{j.role} requires {j.skills_required}"
+    return {"text": txt, "meta": {"source_id": j.jd_id, "kind":"jd", "span":"skills_required"}}
+
+def build_docs(courses: Iterable[Course], jds: Iterable[JD]) -> List[Dict]:
+    """Retrieval corpus: course docs, then JD docs."""
+    return [course_doc(c) for c in courses] + [jd_doc(j) for j in jds]
+
+def paths() -> List[str]:
+    return [os.path.join(DATA_DIR, "courses.jsonl"), os.path.join(DATA_DIR, "jds.jsonl")]
+
+def mtimes() -> Tuple[float, ...]:
+    return tuple(os.path.getmtime(p) if os.path.exists(p) else 0.0 for p in paths())
+
+def diff(current: Dict[str, T], new: Dict[str, T]) -> Tuple[List[T], List[str]]:
+    """(added or changed items, removed keys) to go from current to new."""
+    upserts = [v for k, v in new.items() if current.get(k) != v]
+    deletes = [k for k in current if k not in new]
+    return upserts, deletes
@@ -0,0 +1,285 @@
+# app/catalog_store.py
+"""Compact, columnar course catalog with a skill -> (level, course) inverted index.
+
+Courses are stored as columns instead of one pydantic model each. Skill
+tags ("python:b"), difficulties, prerequisites and outcomes are interned
+once per catalog, and per-course lists are CSR segments of int32 ids. A
+Course is only materialized when a caller asks for one (catalog[course_id]),
+so a large catalog costs a few ints per tag rather than a model, lists and
+strings per course.
+"""
+import itertools, sys
+from collections.abc import Mapping
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+import numpy as np
+from scipy import sparse
+from app.schemas import Course
+from app.services.planner import parse_skill_tag
+
+_CHUNK = 8192   # courses encoded per batch while loading (bounds the transient lists)
+
+
+class _Pool:
+    """Interns strings to dense int ids (ids are never reused)."""
+    __slots__ = ("ids", "names")
+
+    def __init__(self):
+        self.ids: Dict[str, int] = {}
+        self.names: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def add(self, s: str) -> int:
+        i = self.ids.get(s)
+        if i is None:
+            i = self.ids[s] = len(self.names)
+            self.names.append(s)
+        return i
+
+    def copy(self) -> "_Pool":
+        out = _Pool()
+        out.ids, out.names = dict(self.ids), list(self.names)
+        return out
+
+
+class _Csr(NamedTuple):
+    """One variable-length int list per row: row i is vals[ptr[i]:ptr[i + 1]]."""
+    ptr: np.ndarray     # int64, n_rows + 1
+    vals: np.ndarray    # int32
+
+    @classmethod
+    def from_lists(cls, lists: List[List[int]]) -> "_Csr":
+        ptr = np.zeros(len(lists) + 1, dtype=np.int64)
+        np.cumsum([len(l) for l in lists], out=ptr[1:])
+        vals = np.fromiter(itertools.chain.from_iterable(lists), dtype=np.int32, count=int(ptr[-1]))
+        return cls(ptr, vals)
+
+    def row(self, i: int) -> np.ndarray:
+        return self.vals[self.ptr[i]:self.ptr[i + 1]]
+
+    def take(self, rows: np.ndarray) -> "_Csr":
+        lens = self.ptr[rows + 1] - self.ptr[rows]
+        ptr = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum(lens, out=ptr[1:])
+        idx = np.repeat(self.ptr[rows] - ptr[:-1], lens) + np.arange(ptr[-1])
+        return _Csr(ptr, self.vals[idx])
+
+    @staticmethod
+    def concat(parts: List["_Csr"]) -> "_Csr":
+        ptrs, off = [np.zeros(1, dtype=np.int64)], 0
+        for p in parts:
+            ptrs.append(p.ptr[1:] + off)
+            off += int(p.ptr[-1])
+        vals = [p.vals for p in parts] or [np.zeros(0, dtype=np.int32)]
+        return _Csr(np.concatenate(ptrs), np.concatenate(vals))
+
+
+class _Columns(NamedTuple):
+    ids: List[str]
+    titles: List[str]
+    difficulty: np.ndarray      # int32 string ids
+    duration: np.ndarray        # int32 weeks
+    skills: _Csr                # tag ids
+    prereqs: _Csr               # string ids
+    outcomes: _Csr              # string ids
+
+    def take(self, rows: np.ndarray) -> "_Columns":
+        return _Columns([self.ids[r] for r in rows], [self.titles[r] for r in rows],
+                        self.difficulty[rows], self.duration[rows],
+                        self.skills.take(rows), self.prereqs.take(rows), self.outcomes.take(rows))
+
+    @staticmethod
+    def concat(parts: List["_Columns"]) -> "_Columns":
+        return _Columns(
+            [i for p in parts for i in p.ids], [t for p in parts for t in p.titles],
+            np.concatenate([p.difficulty for p in parts] or [np.zeros(0, dtype=np.int32)]),
+            np.concatenate([p.duration for p in parts] or [np.zeros(0, dtype=np.int32)]),
+            _Csr.concat([p.skills for p in parts]), _Csr.concat([p.prereqs for p in parts]),
+            _Csr.concat([p.outcomes for p in parts]),
+        )
+
+
+class CourseStore(Mapping):
+    """Read-only course_id -> Course mapping over columnar storage.
+
+    `rows` maps course_id to its row; everything per course is addressed by
+    row. `levels` is the (course x skill) matrix of the level each course
+    teaches a skill at, and `by_skill` is its transpose: for every interned
+    skill, the courses teaching it and at which level. Updates go through
+    with_changes(), which returns a new store (readers keep the old one).
+    """
+
+    def __init__(self, courses: Iterable[Course] = ()):
+        self.tags, self.skills, self.strings = _Pool(), _Pool(), _Pool()
+        self._tag_skill: List[int] = []
+        self._tag_level: List[int] = []
+        it = iter(courses)
+        chunks = []
+        while True:
+            batch = list(itertools.islice(it, _CHUNK))
+            if not batch:
+                break
+            chunks.append(self._encode(batch))
+        self._set(_Columns.concat(chunks))
+
+    def _encode(self, courses: List[Course]) -> _Columns:
+        tag_ids = []
+        for c in courses:
+            row = []
+            for t in c.skills:
+                n = len(self.tags)
+                i = self.tags.add(t)
+                if i == n:
+                    name, lvl = parse_skill_tag(t)
+                    self._tag_skill.append(self.skills.add(name))
+                    self._tag_level.append(lvl)
+                row.append(i)
+            tag_ids.append(row)
+        s = self.strings
+        return _Columns(
+            [sys.intern(c.course_id) for c in courses], [c.title for c in courses],
+            np.fromiter((s.add(c.difficulty) for c in courses), dtype=np.int32, count=len(courses)),
+            np.fromiter((c.duration_weeks for c in courses), dtype=np.int32, count=len(courses)),
+            _Csr.from_lists(tag_ids),
+            _Csr.from_lists([[s.add(p) for p in c.prerequisites] for c in courses]),
+            _Csr.from_lists([[s.add(o) for o in c.outcomes] for c in courses]),
+        )
+
+    def _set(self, cols: _Columns) -> None:
+        rows = {cid: i for i, cid in enumerate(cols.ids)}
+        if len(rows) < len(cols.ids):
+            # duplicate course_ids: the last one wins, as in a dict
+            cols = cols.take(np.fromiter(sorted(rows.values()), dtype=np.int64, count=len(rows)))
+            rows = {cid: i for i, cid in enumerate(cols.ids)}
+        self._cols = cols
+        self.rows = rows
+        self.ids = cols.ids
+        self.duration = cols.duration
+        self.n_tags = np.diff(cols.skills.ptr)      # tags per course, duplicates included
+        self.tag_skill = np.asarray(self._tag_skill, dtype=np.int32)
+        self.tag_level = np.asarray(self._tag_level, dtype=np.uint8)
+
+        n, t = len(cols.ids), cols.skills
+        course = np.repeat(np.arange(n, dtype=np.int64), self.n_tags)
+        skill, level = self.tag_skill[t.vals], self.tag_level[t.vals]
+        # a course may list a skill twice; keep the highest level
+        order = np.lexsort((level, skill, course))
+        course, skill, level = course[order], skill[order], level[order]
+        last = np.ones(len(course), dtype=bool)
+        last[:-1] = (course[1:] != course[:-1]) | (skill[1:] != skill[:-1])
+        self.levels = sparse.csr_matrix((level[last], (course[last], skill[last])),
+                                        shape=(n, len(self.skills)))
+        self._by_skill: Optional[sparse.csc_matrix] = None
+
+    @property
+    def by_skill(self) -> sparse.csc_matrix:
+        """Inverted index: column s lists (course row, level) for every course teaching skill s."""
+        if self._by_skill is None:
+            m = self.levels.tocsc()
+            m.sort_indices()
+            self._by_skill = m
+        return self._by_skill
+
+    # --- Mapping[str, Course] ---
+
+    def __getitem__(self, course_id: str) -> Course:
+        return self.course(self.rows[course_id])
+
+    def __contains__(self, course_id) -> bool:
+        return course_id in self.rows
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.ids)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def course(self, row: int) -> Course:
+        c, s = self._cols, self.strings.names
+        return Course.model_construct(
+            course_id=c.ids[row],
+            title=c.titles[row],
+            skills=[self.tags.names[i] for i in c.skills.row(row)],
+            difficulty=s[c.difficulty[row]],
+            duration_weeks=int(c.duration[row]),
+            prerequisites=[s[i] for i in c.prereqs.row(row)],
+            outcomes=[s[i] for i in c.outcomes.row(row)],
+        )
+
+    # --- gap-driven lookup ---
+
+    def skill_courses(self, skill: str, min_level: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+        """(rows, levels) of the courses teaching skill at min_level or above, by row."""
+        sid = self.skills.ids.get(skill)
+        if sid is None:
+            return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.uint8)
+        m = self.by_skill
+        rows = m.indices[m.indptr[sid]:m.indptr[sid + 1]]
+        levels = m.data[m.indptr[sid]:m.indptr[sid + 1]]
+        if min_level > 1:
+            keep = levels >= min_level
+            rows, levels = rows[keep], levels[keep]
+        return rows, levels
+
+    def gap_candidates(self, need: Dict[str, int], limit: int, exclude: Iterable[int] = ()) -> List[int]:
+        """Rows of up to `limit` courses covering `need` (skill -> target level), best first.
+
+        A course scores 2 per needed skill it teaches at the target level or
+        above and 1 per needed skill it teaches below it; ties keep catalog
+        order. Only the posting lists of the needed skills are touched.
+        """
+        if limit <= 0 or not need:
+            return []
+        parts = [self.skill_courses(k) for k in need]
+        rows = np.concatenate([r for r, _ in parts])
+        if not len(rows):
+            return []
+        weights = np.concatenate([np.where(lv >= max(1, t), 2, 1) for (_, lv), t in zip(parts, need.values())])
+        cand, inv = np.unique(rows, return_inverse=True)
+        score = np.bincount(inv, weights=weights)
+        ex = np.fromiter(exclude, dtype=np.int64)
+        if len(ex):
+            score[np.isin(cand, ex)] = 0
+        out: List[int] = []
+        # scores are small integers: walk them from the top instead of sorting every candidate
+        for s in np.unique(score)[::-1]:
+            if s <= 0 or len(out) >= limit:
+                break
+            out.extend(cand[score == s][: limit - len(out)].tolist())
+        return out
+
+    # --- updates ---
+
+    def with_changes(self, upserts: Iterable[Course], deletes: Iterable[str]) -> "CourseStore":
+        """New store without `deletes`, with `upserts` added or replaced (appended at the end).
+
+        Kept courses are sliced out of the columns, never re-parsed. Pools
+        only grow, so strings of deleted courses stay until the next full load.
+        """
+        upserts = list(upserts)
+        drop = set(deletes) | {c.course_id for c in upserts}
+        keep = np.fromiter((r for r, cid in enumerate(self.ids) if cid not in drop), dtype=np.int64)
+        out = CourseStore.__new__(CourseStore)
+        out.tags, out.skills, out.strings = self.tags.copy(), self.skills.copy(), self.strings.copy()
+        out._tag_skill, out._tag_level = list(self._tag_skill), list(self._tag_level)
+        parts = [self._cols.take(keep)]
+        if upserts:
+            parts.append(out._encode(upserts))
+        out._set(_Columns.concat(parts))
+        return out
+
+    def memory_bytes(self) -> int:
+        """Approximate resident size of the columns, pools and indexes."""
+        c = self._cols
+        arrays = [c.difficulty, c.duration, self.n_tags, self.tag_skill, self.tag_level,
+                  *c.skills, *c.prereqs, *c.outcomes,
+                  self.levels.data, self.levels.indices, self.levels.indptr]
+        if self._by_skill is not None:
+            arrays += [self._by_skill.data, self._by_skill.indices, self._by_skill.indptr]
+        total = sum(a.nbytes for a in arrays)
+        total += sys.getsizeof(c.ids) + sys.getsizeof(c.titles) + sys.getsizeof(self.rows)
+        total += sum(sys.getsizeof(s) for s in itertools.chain(c.ids, c.titles))
+        for pool in (self.tags, self.skills, self.strings):
+            total += sys.getsizeof(pool.ids) + sys.getsizeof(pool.names) + sum(map(sys.getsizeof, pool.names))
+        return total
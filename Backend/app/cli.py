@@ -0,0 +1,107 @@
+# app/cli.py
+"""Operational commands: python -m app.cli <command> [options]."""
+import argparse, itertools
+from typing import Dict, Iterator, List, Tuple
+import structlog
+from app import catalog
+from app.config import settings
+from app.schemas import JD, AdviseRequest, Profile
+
+log = structlog.get_logger()
+
+def _warm_profiles(args, jds: Dict[str, JD]) -> Iterator[AdviseRequest]:
+    """Profiles to warm for: --profiles (NDJSON /advise bodies, e.g. sampled
+    from real traffic), else --signatures synthetic ones per role."""
+    if args.profiles:
+        with open(args.profiles) as f:
+            for line in f:
+                if line.strip():
+                    req = AdviseRequest.model_validate_json(line)
+                    if not args.role or req.profile.goal_role in args.role:
+                        yield req
+        return
+    for jd in jds.values():
+        if args.role and jd.role not in args.role:
+            continue
+        # skills required at a low level are the ones people most often
+        # already have: drop none, then one, then two... of those first
+        easy = sorted(jd.skills_required, key=lambda s: (jd.skills_required[s], s))
+        held = itertools.chain.from_iterable(itertools.combinations(easy, r) for r in range(len(easy)))
+        for skills in itertools.islice(held, args.signatures):
+            yield AdviseRequest(profile=Profile(skills={s: jd.skills_required[s] for s in skills},
+                                                years=0, goal_role=jd.role))
+
+def warm_explanations(args) -> None:
+    """Pre-generate "why" text for the plans representative profiles get.
+
+    Explanations are cached per (course, role, set of missing skills), so
+    each distinct gap signature is planned exactly like /advise plans it and
+    only the courses the planner picks for it are explained.
+    """
+    from fastapi import HTTPException
+    from app import main as app_main
+    from app.services import llm
+    from app.services.explain_cache import explanations
+    app_main.warm_up()
+    if not app_main.readiness.ready:
+        raise SystemExit("warm-up failed; see the log")
+    items: List[Tuple[JD, Dict[str, int]]] = []
+    seen = set()
+    for req in _warm_profiles(args, app_main.JDS):
+        try:
+            jd, gap_map = app_main.prepare_request(req)
+        except HTTPException as e:
+            log.warning("warm_explanations_skipped", role=req.profile.goal_role, err=e.detail)
+            continue
+        key = (jd.role, tuple(sorted(gap_map)))
+        if gap_map and key not in seen:
+            seen.add(key)
+            items.append((jd, gap_map))
+    pairs = 0
+    for i in range(0, len(items), args.batch):
+        chunk = items[i:i + args.batch]
+        drafts = app_main.build_plans(chunk)
+        llm.generate_explanations_many([(d.chosen, jd.role, gaps) for d, (jd, gaps) in zip(drafts, chunk)],
+                                       deadline_sec=args.deadline)
+        pairs += sum(len(d.chosen) for d in drafts)
+        log.info("warm_explanations_progress", signatures=i + len(chunk), of=len(items))
+    log.info("warm_explanations_done", signatures=len(items), pairs=pairs, cache=explanations.stats())
+
+def build_index(args) -> None:
+    """Compile the catalog into memory-mappable retrieval artifacts under --out.
+
+    A no-op when the catalog and embedding model are unchanged; otherwise only
+    new or edited docs are embedded.
+    """
+    import json
+    from app.retrieval import artifacts
+    from app.retrieval.vector import embedding_signature, get_embeddings
+    docs = catalog.build_docs(catalog.iter_courses(args.courses), catalog.iter_jds(args.jds))
+    manifest = artifacts.build(args.out, docs, get_embeddings(), embedding_signature(), force=args.force)
+    print(json.dumps(manifest, indent=2))
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m app.cli")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    warm = sub.add_parser("warm-explanations",
+                          help="fill the explanation cache for the plans of representative profiles")
+    warm.add_argument("--profiles", default=None, help="NDJSON of /advise bodies to warm for (default: synthesized)")
+    warm.add_argument("--role", action="append", help="only this role (repeatable)")
+    warm.add_argument("--signatures", type=int, default=16, help="synthesized gap signatures per role")
+    warm.add_argument("--batch", type=int, default=8, help="plans explained per wave")
+    warm.add_argument("--deadline", type=float, default=60.0, help="seconds per wave before falling back")
+    warm.set_defaults(func=warm_explanations)
+
+    idx = sub.add_parser("build-index", help="write mmap-able embeddings/BM25/doc artifacts for INDEX_DIR")
+    idx.add_argument("--courses", default=None, help="courses.jsonl (default: app/data)")
+    idx.add_argument("--jds", default=None, help="jds.jsonl (default: app/data)")
+    idx.add_argument("--out", default=settings.INDEX_DIR or "index", help="artifact root (default: $INDEX_DIR)")
+    idx.add_argument("--force", action="store_true", help="rebuild and re-embed everything")
+    idx.set_defaults(func=build_index)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -9,16 +9,70 @@ env_path = ROOT / ".env"
 load_dotenv(dotenv_path=str(env_path) if env_path.exists() else find_dotenv())
 
 class Settings:
+    DATA_DIR = os.getenv("DATA_DIR", str(ROOT / "app" / "data"))  # courses.jsonl / jds.jsonl
+    INDEX_DIR = os.getenv("INDEX_DIR", "")  # prebuilt artifacts (python -m app.cli build-index); empty = build in memory
+    CATALOG_WATCH_SEC = float(os.getenv("CATALOG_WATCH_SEC", "0"))  # poll the JSONL files for changes; 0 = off
+    ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")  # X-Admin-Token for /admin/*; unset = admin routes disabled (404)
     PINECONE_API_KEY = os.getenv("PINECONE_API_KEY", "adb8903f-0ee1-4f9a-9821-6bcd11cebf8e")
     PINECONE_INDEX = os.getenv("PINECONE_INDEX", "upskill-courses")
     PINECONE_HOST = os.getenv("PINECONE_HOST", None)
+    VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "pinecone").lower()  # "pinecone" | "local"
     EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+    EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "hf").lower()  # "hf" | "hash" (offline stand-in)
+    EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM", "384"))  # used by the hash backend
+    DENSE_QUANTIZATION = os.getenv("DENSE_QUANTIZATION", "none").lower()  # local index: "none" | "int8" | "float16"
+    DENSE_RESCORE_FACTOR = int(os.getenv("DENSE_RESCORE_FACTOR", "4"))  # candidates re-scored in float32 = k * factor
     CROSS_ENCODER_MODEL = os.getenv("CROSS_ENCODER_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+    RERANKER_BACKEND = os.getenv("RERANKER_BACKEND", "cross-encoder").lower()  # "cross-encoder" | "overlap"
     OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "")
     TOP_K_VECTOR = int(os.getenv("TOP_K_VECTOR", "20"))
     TOP_K_BM25 = int(os.getenv("TOP_K_BM25", "20"))
     RERANK_TOPN = int(os.getenv("RERANK_TOPN", "50"))
+    RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "32"))
+    RERANK_CACHE_SIZE = int(os.getenv("RERANK_CACHE_SIZE", "50000"))
+    # comma-separated meta["kind"] values to rerank (e.g. "course"); empty = all
+    RERANK_KINDS = [k.strip() for k in os.getenv("RERANK_KINDS", "").split(",") if k.strip()]
+    FUSION_TOPK = int(os.getenv("FUSION_TOPK", "0"))  # fused candidates kept (0 = all the legs return)
+    RERANK_MAX_CANDIDATES = int(os.getenv("RERANK_MAX_CANDIDATES", "40"))  # cascade cap on cross-encoder input (0 = no cap)
+    PLAN_BUDGET_MS = int(os.getenv("PLAN_BUDGET_MS", "0"))  # per-request budget up to planning; rerank truncated/skipped to fit (0 = off)
+    PLAN_GAP_CANDIDATES = int(os.getenv("PLAN_GAP_CANDIDATES", "20"))  # planner pool extra: courses teaching the gaps, from the skill index (0 = retrieval only)
     RETURN_TOP = int(os.getenv("RETURN_TOP", "8"))
+    PLAN_CACHE_SIZE = int(os.getenv("PLAN_CACHE_SIZE", "10000"))
+    PLAN_STORE_SIZE = int(os.getenv("PLAN_STORE_SIZE", "10000"))  # plans addressable by plan_id
+    PDF_CACHE_MB = int(os.getenv("PDF_CACHE_MB", "64"))
+    # background cohort exports (POST /exports): files under EXPORT_DIR, PDFs rendered by worker processes
+    EXPORT_DIR = os.getenv("EXPORT_DIR", str(ROOT / ".cache" / "exports"))
+    EXPORT_RENDER_WORKERS = int(os.getenv("EXPORT_RENDER_WORKERS", "2"))  # 0 = render on the job thread
+    EXPORT_MAX_JOBS = int(os.getenv("EXPORT_MAX_JOBS", "2"))  # jobs running at once; others wait queued
+    EXPORT_LLM_CONCURRENCY = int(os.getenv("EXPORT_LLM_CONCURRENCY", "2"))  # LLM calls in flight for exports, on top of LLM_MAX_CONCURRENCY
+    EXPORT_WINDOW = int(os.getenv("EXPORT_WINDOW", "64"))  # PDFs rendering ahead of the ZIP writer
+    EXPORT_KEEP_JOBS = int(os.getenv("EXPORT_KEEP_JOBS", "20"))  # finished jobs (and files) kept
+    EXPORT_MAX_UPLOAD_MB = int(os.getenv("EXPORT_MAX_UPLOAD_MB", "256"))
+    EXPORT_MERGED_MAX = int(os.getenv("EXPORT_MERGED_MAX", "5000"))  # profiles per format=pdf document
+    WARMUP_BACKGROUND = os.getenv("WARMUP_BACKGROUND", "1") == "1"  # build indexes after the server is up
+    WARMUP_RETRIES = int(os.getenv("WARMUP_RETRIES", "3"))  # failed warm-ups retried before /health/live fails
+    WARMUP_RETRY_SEC = float(os.getenv("WARMUP_RETRY_SEC", "2"))  # first backoff; doubles per attempt (max 60s)
+    SINGLE_FLIGHT = os.getenv("SINGLE_FLIGHT", "1") == "1"  # coalesce concurrent identical /advise requests
+    # embeddings + cross-encoder in warm worker processes, micro-batched across requests (0 = in-process)
+    INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "0"))
+    INFERENCE_MAX_BATCH = int(os.getenv("INFERENCE_MAX_BATCH", "64"))  # texts / pairs per worker call
+    INFERENCE_MAX_WAIT_MS = float(os.getenv("INFERENCE_MAX_WAIT_MS", "2"))  # how long a batch waits to fill
+    STAGE_WORKERS = int(os.getenv("STAGE_WORKERS", "16"))  # threads for blocking /advise stages
+    BATCH_CHUNK_SIZE = int(os.getenv("BATCH_CHUNK_SIZE", "512"))  # /advise/batch profiles per batched pass
+    # opt-in request profiling: X-Profile: 1 (spans) / cpu (spans + sampled stacks), or a sampled share of traffic
+    PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+    PROFILE_RING_SIZE = int(os.getenv("PROFILE_RING_SIZE", "256"))  # profiles kept for GET /debug/profile/{trace_id}
+    PROFILE_STACK_INTERVAL_MS = float(os.getenv("PROFILE_STACK_INTERVAL_MS", "5"))
     GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+    LLM_BACKEND = os.getenv("LLM_BACKEND", "gemini").lower()  # "gemini" | "stub" | "none"
+    LLM_MODEL = os.getenv("LLM_MODEL", "gemini-1.5-flash")
+    LLM_EXPLAIN_MODE = os.getenv("LLM_EXPLAIN_MODE", "plan").lower()  # "plan" (one JSON call per plan) | "course" (one call each)
+    LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+    LLM_DEADLINE_SEC = float(os.getenv("LLM_DEADLINE_SEC", "8"))
+    LLM_STUB_LATENCY_MS = float(os.getenv("LLM_STUB_LATENCY_MS", "0"))
+    # "why" text cache: LRU in memory + SQLite on disk (empty path = memory only)
+    EXPLAIN_CACHE_PATH = os.getenv("EXPLAIN_CACHE_PATH", str(ROOT / ".cache" / "explanations.sqlite3"))
+    EXPLAIN_CACHE_TTL_SEC = float(os.getenv("EXPLAIN_CACHE_TTL_SEC", str(7 * 86400)))
+    EXPLAIN_CACHE_SIZE = int(os.getenv("EXPLAIN_CACHE_SIZE", "4096"))
 
 settings = Settings()
@@ -1,23 +1,31 @@
-import json, os
-from fastapi import FastAPI, HTTPException, Request, Response
-from fastapi.responses import StreamingResponse
-from typing import List, Dict
+import asyncio, itertools, json, os, secrets, threading, time
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import FastAPI, Header, HTTPException, Request, Response
+from fastapi.responses import FileResponse, StreamingResponse
+from typing import Dict, Iterator, List, Optional, Tuple, Union
 import structlog
 from app.config import settings
+from app import catalog
+from app.catalog_store import CourseStore
 from app.schemas import *
 from app.services.metrics import metrics, new_trace_id
 from app.services.safety import redact_pii, detect_prompt_injection
-from app.services.pdf import render_plan_pdf
+from app.services.pdf import plan_digest, render_plan_pdf_bytes
 from app.services import planner
 # --- NEW IMPORT ---
 from app.services import llm
-from app.retrieval.bm25 import build_bm25
-from app.retrieval.vector import build_vectorstore
-from app.retrieval.hybrid import build_hybrid_retriever, rerank
-from sentence_transformers import SentenceTransformer  # as local fallback embed
+from app.retrieval import artifacts
+from app.retrieval.bm25 import SimpleBM25Retriever, build_bm25, to_documents
+from app.retrieval.vector import apply_vector_changes, build_vectorstore, doc_id, embedding_signature, get_embeddings
+from app.retrieval.hybrid import build_hybrid_retriever, calibrate_reranker, rerank, rerank_many, retrieve, retrieve_many, aretrieve, get_cross_encoder, pair_scores
+from app.models import PlanDraft, RetrievedDoc
+from app.services.cache import BytesLRUCache, LRUCache
+from app.services.readiness import Readiness
+from app.services.singleflight import SingleFlight
+from app.services import profiling
+from app.services.inference import close_pool, get_pool
+from app.services.exports import FORMATS as EXPORT_FORMATS, ExportManager
 from langchain_core.documents import Document
-from fastapi.responses import FileResponse
-import tempfile, os
 from fastapi.middleware.cors import CORSMiddleware
 
 log = structlog.get_logger()
@@ -25,7 +33,7 @@ app = FastAPI(title="A4 Upskill Advisor API")
 
 # ... (keep the existing code for CORS, catalogs, retrievers, load_catalog, build_docs)
 # In-memory catalogs
-COURSES: Dict[str, Course] = {}
+COURSES: CourseStore = CourseStore()   # columnar; COURSES[course_id] materializes a Course
 JDS: Dict[str, JD] = {}
 origins = [
     "http://localhost:5173",
@@ -47,39 +55,212 @@ bm25_ret = None
 vectorstore = None
 hybrid = None
 
+# (goal_role, gap signature, index version) -> PlanDraft; everything in a plan
+# except the LLM text is a pure function of the JD, the gaps and the indexes
+plan_cache = LRUCache(settings.PLAN_CACHE_SIZE)
+index_version = 0
+
+# Concurrent identical requests (same role, gaps and index version) wait on
+# one in-flight computation instead of each running retrieval, rerank and LLM
+advise_flight = SingleFlight("advise", settings.SINGLE_FLIGHT)
+plan_flight = SingleFlight("plan", settings.SINGLE_FLIGHT)
+
+# plan_id -> (goal_role, AdviseResponse) for recently served plans, and
+# content-addressed rendered PDFs (plan_id doubles as the PDF key)
+plan_store = LRUCache(settings.PLAN_STORE_SIZE)
+pdf_cache = BytesLRUCache(settings.PDF_CACHE_MB * 1024 * 1024)
+
+# Blocking pipeline stages (retrieval legs, rerank, planning, PDF) run here,
+# not on the event loop and not in Starlette's shared threadpool
+stage_pool = ThreadPoolExecutor(max_workers=settings.STAGE_WORKERS, thread_name_prefix="stage")
+
+# Cohort exports run on their own threads and render processes; planning goes
+# through advise_batch, so they share the plan cache with the API, but their
+# LLM calls have a pool of their own so a big export cannot starve /advise
+export_llm_pool = ThreadPoolExecutor(max_workers=settings.EXPORT_LLM_CONCURRENCY, thread_name_prefix="export-llm")
+exports = ExportManager(settings.EXPORT_DIR, lambda reqs: advise_batch(reqs, llm_executor=export_llm_pool),
+                        lambda g, p: _pdf_args(g, p),
+                        pdf_cache, workers=settings.EXPORT_RENDER_WORKERS, max_jobs=settings.EXPORT_MAX_JOBS,
+                        window=settings.EXPORT_WINDOW, chunk_size=settings.BATCH_CHUNK_SIZE,
+                        keep=settings.EXPORT_KEEP_JOBS, merged_max=settings.EXPORT_MERGED_MAX)
+
+async def offload(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(stage_pool, profiling.bind(fn), *args)
+
 def load_catalog():
-    base = os.path.join(os.path.dirname(__file__), "data")
-    with open(os.path.join(base, "courses.jsonl")) as f:
-        for line in f:
-            c = Course.model_validate_json(line)
-            COURSES[c.course_id] = c
-    with open(os.path.join(base, "jds.jsonl")) as f:
-        for line in f:
-            j = JD.model_validate_json(line)
-            JDS[j.role] = j
+    global COURSES
+    COURSES = CourseStore(catalog.iter_courses())
+    JDS.update(catalog.load_jds())
 
 def build_docs() -> List[Dict]:
-    docs = []
-    # course docs
-    for c in COURSES.values():
-        txt = f"{c.title}. Skills: {', '.join(c.skills)}. Outcomes: {', '.join(c.outcomes)}. Diff: {c.difficulty}"
-        docs.append({"text": txt, "meta": {"source_id": c.course_id, "kind":"course", "span":"skills"}})
-    # jd docs
-    for j in JDS.values():
-        txt = f"{j.role} requires {j.skills_required}"
-        docs.append({"text": txt, "meta": {"source_id": j.jd_id, "kind":"jd", "span":"skills_required"}})
-    return docs
+    return catalog.build_docs(COURSES.values(), JDS.values())
+
+def invalidate_caches():
+    """Drop everything derived from the catalog/indexes; call after any rebuild."""
+    global index_version
+    index_version += 1
+    plan_cache.clear()
+    pair_scores.clear()
+
+# Serializes catalog writers (admin API, file watcher). Readers never take it:
+# every update builds new dicts/indexes and swaps the module globals, so a
+# request sees either the old catalog or the new one.
+_catalog_lock = threading.RLock()
+_watch_stop = threading.Event()
+
+def apply_catalog_changes(changes: CatalogChanges) -> Dict:
+    """Incrementally upsert/delete courses and JDs.
+
+    Only changed docs are tokenized and embedded; BM25 and the local vector
+    index are copied with the changes applied (Pinecone is upserted in place),
+    the hybrid retriever is rebuilt over them and swapped in, then caches
+    derived from the old catalog are invalidated.
+    """
+    global COURSES, JDS, bm25_ret, vectorstore, hybrid
+    with _catalog_lock:
+        jds = dict(JDS)
+        upserts: Dict[str, Dict] = {}
+        deletes = set()
+        for cid in changes.delete_courses:
+            if cid in COURSES:
+                deletes.add(doc_id({"kind": "course", "source_id": cid}))
+        for role in changes.delete_jds:
+            old = jds.pop(role, None)
+            if old is not None:
+                deletes.add(doc_id(catalog.jd_doc(old)["meta"]))
+        for c in changes.upsert_courses:
+            d = catalog.course_doc(c)
+            upserts[doc_id(d["meta"])] = d
+        for j in changes.upsert_jds:
+            old = jds.get(j.role)
+            if old is not None and old.jd_id != j.jd_id:
+                deletes.add(doc_id(catalog.jd_doc(old)["meta"]))
+            jds[j.role] = j
+            d = catalog.jd_doc(j)
+            upserts[doc_id(d["meta"])] = d
+        deletes -= upserts.keys()
+        if not upserts and not deletes:
+            return {"upserted": 0, "deleted": 0, "courses": len(COURSES), "jds": len(JDS), "index_version": index_version}
+
+        docs = list(upserts.values())
+        new_bm25 = bm25_ret.with_changes(to_documents(docs), deletes)
+        new_store = apply_vector_changes(vectorstore, docs, deletes)
+        new_hybrid = build_hybrid_retriever(new_bm25, new_store)
+        touched = {c.course_id for c in changes.upsert_courses} | set(changes.delete_courses)
+        courses = COURSES.with_changes(changes.upsert_courses, changes.delete_courses) if touched else COURSES
+        courses.by_skill  # build the inverted index before the swap, not on the next request
+
+        COURSES, JDS = courses, jds
+        bm25_ret, vectorstore = new_bm25, new_store
+        hybrid = new_hybrid
+        invalidate_caches()
+        for cid in touched:
+            llm.explanations.invalidate_course(cid)
+        summary = {"upserted": len(upserts), "deleted": len(deletes), "courses": len(COURSES),
+                   "jds": len(JDS), "index_version": index_version}
+    log.info("catalog_updated", **summary)
+    return summary
+
+def reload_catalog() -> Dict:
+    """Re-read the JSONL files and apply only what differs from the live catalog."""
+    with _catalog_lock:
+        course_up, course_del = catalog.diff(COURSES, catalog.load_courses())
+        jd_up, jd_del = catalog.diff(JDS, catalog.load_jds())
+        return apply_catalog_changes(CatalogChanges(upsert_courses=course_up, delete_courses=course_del,
+                                                    upsert_jds=jd_up, delete_jds=jd_del))
+
+def _watch_catalog(interval: float):
+    seen = catalog.mtimes()
+    while not _watch_stop.wait(interval):
+        now = catalog.mtimes()
+        if now == seen:
+            continue
+        seen = now
+        try:
+            reload_catalog()
+        except Exception as e:
+            # e.g. a half-written file; the next write changes the mtime again
+            log.error("catalog_reload_failed", err=str(e))
+
+# Warm-up progress; /health/ready and the plan endpoints gate on it.
+# The LLM is optional: without it explanations use the template fallback.
+readiness = Readiness(required=("catalog", "planner", "bm25", "dense", "hybrid", "reranker"),
+                      optional=("llm",))
+
+def warm_up():
+    """Load the catalog, build every index and load the models, reporting progress.
+
+    A failed warm-up is retried WARMUP_RETRIES times with exponential backoff
+    (every step is idempotent). After the last failure the process is marked
+    fatal, so /health/live fails and the orchestrator restarts it.
+    """
+    t0 = time.perf_counter()
+    delay = settings.WARMUP_RETRY_SEC
+    for attempt in range(settings.WARMUP_RETRIES + 1):
+        try:
+            _warm_up()
+            break
+        except Exception as e:
+            log.error("warm_up_failed", err=str(e), attempt=attempt + 1, status=readiness.snapshot()["components"])
+            if attempt == settings.WARMUP_RETRIES:
+                readiness.fail(f"warm-up failed after {attempt + 1} attempts: {e}")
+                return
+            if _watch_stop.wait(delay):     # shutting down
+                return
+            delay = min(delay * 2, 60.0)
+    with readiness.step("llm"):
+        backend = llm.get_backend()
+    readiness.set("llm", "ready" if backend else "disabled")
+    if settings.CATALOG_WATCH_SEC > 0:
+        _watch_stop.clear()
+        threading.Thread(target=_watch_catalog, args=(settings.CATALOG_WATCH_SEC,),
+                         daemon=True, name="catalog-watch").start()
+    log.info("startup_complete", courses=len(COURSES), jds=len(JDS), sec=round(time.perf_counter() - t0, 3))
+
+def _warm_up():
+    global bm25_ret, vectorstore, hybrid
+    if settings.INFERENCE_WORKERS > 0:
+        with readiness.step("inference"):
+            get_pool().warm()  # worker processes up with their models loaded
+    with readiness.step("catalog"):
+        load_catalog()
+        docs = build_docs()
+    with readiness.step("planner"):
+        COURSES.by_skill  # skill -> (level, course) inverted index
+    art = None
+    if settings.INDEX_DIR:
+        # shared, memory-mapped artifacts; built here only if the catalog changed
+        with readiness.step("artifacts"):
+            art = artifacts.ensure(settings.INDEX_DIR, docs, get_embeddings(), embedding_signature())
+    with readiness.step("bm25"):
+        if art is None:
+            bm25_ret = build_bm25(docs)
+        else:
+            bm25_ret = SimpleBM25Retriever.from_index(to_documents(docs), art.bm25)
+    with readiness.step("dense"):
+        vectorstore = build_vectorstore(docs, art)
+    with readiness.step("hybrid"):
+        hybrid = build_hybrid_retriever(bm25_ret, vectorstore)
+        invalidate_caches()
+    with readiness.step("reranker"):
+        get_cross_encoder()  # warm the reranker so the first /advise doesn't pay for it
+        calibrate_reranker()  # per-pair cost for PLAN_BUDGET_MS
 
 @app.on_event("startup")
 def startup():
-    load_catalog()
-    docs = build_docs()
-    global bm25_ret, vectorstore, hybrid
-    bm25_ret = build_bm25(docs)
-    vectorstore = build_vectorstore(docs)
-    hybrid = build_hybrid_retriever(bm25_ret, vectorstore)
-    # The LLM model is initialized automatically when llm.py is imported
-    log.info("startup_complete", courses=len(COURSES), jds=len(JDS))
+    # Serve /health/* immediately; indexes and models load behind it
+    readiness.reset()
+    if settings.WARMUP_BACKGROUND:
+        threading.Thread(target=warm_up, daemon=True, name="warm-up").start()
+    else:
+        warm_up()
+
+@app.on_event("shutdown")
+def shutdown():
+    _watch_stop.set()
+    close_pool()
+    exports.close()
+    export_llm_pool.shutdown(wait=False, cancel_futures=True)
 
 
 # ... (keep middleware and other endpoints like /health, /course, /metrics)
@@ -90,79 +271,216 @@ from starlette.responses import JSONResponse
 async def add_trace_and_metrics(request: Request, call_next):
     trace_id = new_trace_id()
     t0 = metrics.start()
+    # opt-in spans (X-Profile header or PROFILE_SAMPLE_RATE), kept by trace id;
+    # the header (which can start a stack sampler) only counts from an admin
+    asked = request.headers.get("x-profile", "")
+    if asked and not _admin_ok(request.headers.get("x-admin-token", "")):
+        asked = ""
+    do_profile, stacks = profiling.wanted(asked)
+    prof = profiling.start(trace_id, request.method, request.url.path, stacks) if do_profile else None
     response = None
     try:
         response = await call_next(request)
         return response
     except Exception as e:
-        metrics.error()
         # log the error with the trace id
         log.error("request_error", trace=trace_id, path=str(request.url), err=str(e))
         # return a safe JSON 500 response
         response = JSONResponse({"detail": "internal error", "trace": trace_id}, status_code=500)
         return response
     finally:
-        dt = metrics.end(t0)
         status = getattr(response, "status_code", 500)
+        # route template (e.g. /plan/{plan_id}/pdf) keeps the label set bounded
+        route = getattr(request.scope.get("route"), "path", None)
+        dt = metrics.end(t0, route=route, status=status)
+        spans = {}
+        if prof is not None:
+            profiling.finish(prof, status, dt)
+            spans = {"spans": prof.breakdown()}
+        if response is not None:
+            response.headers["X-Trace-Id"] = trace_id
         log.info("request_log",
                  trace=trace_id,
                  path=str(request.url),
                  ms=round(dt * 1000, 2),
-                 status=status)
+                 status=status,
+                 **spans)
 
 @app.get("/health")
+@app.get("/health/live")
 def health():
+    # liveness: the process serves HTTP; says nothing about the indexes,
+    # except that a warm-up which gave up for good needs a restart
+    if not readiness.live:
+        return JSONResponse({"ok": False, "error": readiness.fatal}, status_code=503)
     return {"ok": True}
 
+@app.get("/health/ready")
+def health_ready():
+    # readiness: 503 until the catalog, indexes and reranker are loaded
+    snap = readiness.snapshot()
+    return JSONResponse(snap, status_code=200 if snap["ready"] else 503)
+
+def _require_ready():
+    if not readiness.ready:
+        raise HTTPException(503, "warming up; see /health/ready", headers={"Retry-After": "2"})
+
 @app.get("/course/{course_id}", response_model=Course)
 def get_course(course_id: str):
+    _require_ready()
     if course_id not in COURSES:
         raise HTTPException(404, "course not found")
     return COURSES[course_id]
 
+def _admin_ok(token: str) -> bool:
+    return bool(settings.ADMIN_TOKEN) and secrets.compare_digest(token.encode(), settings.ADMIN_TOKEN.encode())
+
+def _require_admin(token: str):
+    # fail closed: without ADMIN_TOKEN the admin routes do not exist
+    if not settings.ADMIN_TOKEN:
+        raise HTTPException(404, "Not Found")
+    if not _admin_ok(token):
+        raise HTTPException(403, "admin token required")
+
+@app.get("/debug/profile/{trace_id}")
+def get_profile(trace_id: str, x_admin_token: str = Header("")):
+    """Spans (and sampled stacks, if requested) of a profiled request."""
+    _require_admin(x_admin_token)
+    prof = profiling.profiles.get(trace_id)
+    if prof is None:
+        raise HTTPException(404, "No profile for this trace id (not profiled, or evicted)")
+    return prof.to_dict()
+
+@app.get("/debug/profiles")
+def list_profiles(x_admin_token: str = Header("")):
+    """Most recent profiled requests first (see PROFILE_RING_SIZE)."""
+    _require_admin(x_admin_token)
+    return [{"trace_id": p.trace_id, "method": p.method, "path": p.path, "status": p.status, "ms": p.ms}
+            for p in reversed(profiling.profiles.values())]
+
+@app.post("/admin/catalog")
+async def admin_catalog(changes: CatalogChanges, x_admin_token: str = Header("")):
+    """Upsert/delete courses and JDs without a restart (in memory; the JSONL files are not rewritten)."""
+    _require_admin(x_admin_token)
+    _require_ready()
+    return await offload(apply_catalog_changes, changes)
+
+@app.post("/admin/catalog/reload")
+async def admin_catalog_reload(x_admin_token: str = Header("")):
+    """Re-read courses.jsonl/jds.jsonl and apply the difference."""
+    _require_admin(x_admin_token)
+    _require_ready()
+    return await offload(reload_catalog)
+
+def _cache_stats() -> Dict[str, Dict]:
+    return {
+        "plan": plan_cache.stats(),
+        "pdf": pdf_cache.stats(),
+        "rerank_pairs": pair_scores.stats(),
+        "explanations": llm.explanations.memory.stats(),
+    }
+
 @app.get("/metrics")
-def get_metrics():
-    return metrics.snapshot()
+def get_metrics(request: Request, format: str = ""):
+    # JSON for the UI; Prometheus text for scrapers (Accept negotiation or ?format=prometheus)
+    accept = request.headers.get("accept", "")
+    if format == "prometheus" or (not format and ("text/plain" in accept or "openmetrics" in accept)):
+        return Response(metrics.prometheus(_cache_stats()), media_type="text/plain; version=0.0.4; charset=utf-8")
+    caches = _cache_stats()
+    return {**metrics.snapshot(), "plan_cache": caches["plan"], "pdf_cache": caches["pdf"],
+            "in_flight": {"advise": len(advise_flight), "plan": len(plan_flight)}}
 
-@app.post("/advise", response_model=AdviseResponse)
-def advise(req: AdviseRequest):
-    # ... (Keep steps 1-7 as they are)
-    # Safety filters (demo)
-    text_blob = json.dumps({"goal_role": req.profile.goal_role, "skills": req.profile.skills})
-    if detect_prompt_injection(text_blob):
-        raise HTTPException(400, "Prompt injection suspected.")
-    # Redact PII from free-text prefs if any
-    prefs = {k: redact_pii(str(v)) for k, v in (req.prefs or {}).items()}
+def _plan_key(jd: JD, gap_map: Dict[str, int]):
+    return (jd.role, planner.gap_signature(gap_map), index_version)
 
-    # 1) Pick JD
-    jd = JDS.get(req.profile.goal_role)
-    if not jd:
-        raise HTTPException(404, "goal_role not supported in JD corpus")
+def plan_deadline() -> Optional[float]:
+    """perf_counter() time by which the plan (up to the LLM step) should be ready."""
+    return time.perf_counter() + settings.PLAN_BUDGET_MS / 1000 if settings.PLAN_BUDGET_MS else None
 
-    # 2) Compute gaps
-    gap_map = planner.compute_gap_map(jd, req.profile)
+def _cacheable(key, draft: PlanDraft) -> bool:
+    # don't store plans computed against replaced indexes, or cut short by the budget
+    return key[-1] == index_version and not draft.degraded
 
+def build_plan(jd: JD, gap_map: Dict[str, int], deadline: Optional[float] = None) -> PlanDraft:
+    key = _plan_key(jd, gap_map)
+    draft = plan_cache.get(key)
+    if draft is None:
+        draft = _build_plan(jd, gap_map, deadline)
+        if _cacheable(key, draft):
+            plan_cache.put(key, draft)
+    return draft
+
+async def abuild_plan(jd: JD, gap_map: Dict[str, int], deadline: Optional[float] = None) -> PlanDraft:
+    """Async build_plan: both retrieval legs overlap, CPU stages are offloaded."""
+    key = _plan_key(jd, gap_map)
+    with profiling.span("plan"):
+        draft = plan_cache.get(key)
+        if draft is None:
+            draft = await plan_flight.do(key, lambda: _abuild_plan(jd, gap_map, key, deadline))
+    return draft
+
+async def _abuild_plan(jd: JD, gap_map: Dict[str, int], key, deadline: Optional[float]) -> PlanDraft:
+    query = plan_query(jd, gap_map)
+    cand_docs = await aretrieve(hybrid, query, stage_pool)
+    reranked = await offload(rerank, query, cand_docs, settings.RERANK_TOPN, None, deadline)
+    draft = await offload(_finish_plan, jd, gap_map, query, reranked)
+    if _cacheable(key, draft):
+        plan_cache.put(key, draft)
+    return draft
+
+def build_plans(items: List[Tuple[JD, Dict[str, int]]]) -> List[PlanDraft]:
+    """build_plan for many (jd, gap_map) pairs with cross-request batching.
+
+    Identical gap signatures are computed once; the unique misses share one
+    batched embedding call and one batched cross-encoder pass.
+    """
+    keys = [_plan_key(jd, gaps) for jd, gaps in items]
+    drafts = {k: plan_cache.get(k) for k in dict.fromkeys(keys)}
+    todo = {k: item for k, item in zip(keys, items) if drafts[k] is None}
+    if todo:
+        queries = [plan_query(jd, gaps) for jd, gaps in todo.values()]
+        cand_lists = retrieve_many(hybrid, queries)
+        reranked = rerank_many(queries, cand_lists, topn=settings.RERANK_TOPN)
+        for (k, (jd, gaps)), q, r in zip(todo.items(), queries, reranked):
+            drafts[k] = _finish_plan(jd, gaps, q, r)
+            if _cacheable(k, drafts[k]):
+                plan_cache.put(k, drafts[k])
+    return [drafts[k] for k in keys]
+
+def plan_query(jd: JD, gap_map: Dict[str, int]) -> str:
     # 3) Build query from gaps
     need = ", ".join([f"{k} lvl{v}" for k,v in gap_map.items()])
-    query = f"Courses to cover: {need} for role {jd.role}"
+    return f"Courses to cover: {need} for role {jd.role}"
+
+def _build_plan(jd: JD, gap_map: Dict[str, int], deadline: Optional[float] = None) -> PlanDraft:
+    query = plan_query(jd, gap_map)
 
-    # 4) Hybrid retrieve then rerank
-    cand_docs = hybrid.get_relevant_documents(query)
-    reranked = rerank(query, cand_docs, topn=settings.RERANK_TOPN)
+    # 4) Hybrid retrieve then rerank (cascade-capped, within the budget)
+    cand_docs = retrieve(hybrid, query)
+    reranked = rerank(query, cand_docs, topn=settings.RERANK_TOPN, deadline=deadline)
+    return _finish_plan(jd, gap_map, query, reranked)
 
-    # 5) Map retrieved courses -> Course objects
-    ret_courses = []
-    for d in reranked:
-        if d.meta.get("kind") == "course" and d.source_id in COURSES:
-            ret_courses.append(COURSES[d.source_id])
+def _finish_plan(jd: JD, gap_map: Dict[str, int], query: str, reranked: List[RetrievedDoc]) -> PlanDraft:
+    with metrics.timer("planning"):
+        return _plan_path(jd, gap_map, query, reranked)
+
+def _plan_path(jd: JD, gap_map: Dict[str, int], query: str, reranked: List[RetrievedDoc]) -> PlanDraft:
+    store = COURSES
+    # 5) Map retrieved courses -> catalog rows, plus the courses that teach
+    # the gaps straight from the skill index (independent of the query text)
+    rows = [store.rows[d.source_id] for d in reranked
+            if d.meta.get("kind") == "course" and d.source_id in store.rows]
+    need = {k: jd.skills_required.get(k, 1) for k in gap_map}
+    rows += store.gap_candidates(need, settings.PLAN_GAP_CANDIDATES, exclude=rows)
 
     # 6) Pick best 3-course path algorithmically (fast & deterministic)
-    chosen = planner.pick_path(ret_courses, gap_map)
-    if len(chosen) < 3:
-        # fill from any remaining
-        for c in COURSES.values():
-            if c not in chosen and len(chosen)<3:
-                chosen.append(c)
+    picked = planner.pick_rows(store, rows, gap_map)
+    if len(picked) < 3:
+        # fill with the best remaining gap courses, then catalog order
+        picked += store.gap_candidates(need, 3 - len(picked), exclude=picked)
+        taken = set(picked)
+        picked += itertools.islice((r for r in range(len(store)) if r not in taken), 3 - len(picked))
+    chosen = [store.course(r) for r in picked]
 
     # 7) Timeline & metrics
     total_weeks, seq = planner.build_timeline(chosen)
@@ -175,41 +493,251 @@ def advise(req: AdviseRequest):
     all_sk = [planner.parse_skill_tag(t)[0] for c in chosen for t in c.skills]
     diversity = len(set(all_sk)) / max(1, len(all_sk))
 
-    # --- STEP 8 IS NOW MODIFIED ---
-    # 8) LLM to generate "why" messages via Google Gemini
+    return PlanDraft(
+        query=query,
+        chosen=chosen,
+        weeks=total_weeks,
+        sequence=seq,
+        coverage=coverage,
+        diversity=diversity,
+        citations=planner.make_citations(reranked),
+        degraded=any(d.meta.get("reranked") is False for d in reranked),
+    )
+
+def prepare_request(req: AdviseRequest) -> Tuple[JD, Dict[str, int]]:
+    _require_ready()
+    # Safety filters (demo)
+    text_blob = json.dumps({"goal_role": req.profile.goal_role, "skills": req.profile.skills})
+    if detect_prompt_injection(text_blob):
+        raise HTTPException(400, "Prompt injection suspected.")
+    # Redact PII from free-text prefs if any
+    prefs = {k: redact_pii(str(v)) for k, v in (req.prefs or {}).items()}
+
+    # 1) Pick JD
+    jd = JDS.get(req.profile.goal_role)
+    if not jd:
+        raise HTTPException(404, "goal_role not supported in JD corpus")
+
+    # 2) Compute gaps
+    with metrics.timer("gap"):
+        return jd, planner.compute_gap_map(jd, req.profile)
+
+PLAN_NOTES = "Path maximizes JD coverage with minimal prereqs; PDF available via /plan/pdf (see docs)."
+
+def make_response(goal_role: str, gap_map: Dict[str, int], draft: PlanDraft, whys: List[str]) -> AdviseResponse:
     plan_items = []
-    citations = planner.make_citations(reranked)
-    for c in chosen:
-        # Use the new LLM service to generate a rich, personalized explanation
-        why_message = llm.generate_course_explanation(c, req.profile.goal_role, gap_map)
-        plan_items.append({"course_id": c.course_id, "why": why_message, "citations": citations})
+    for c, why_message in zip(draft.chosen, whys):
+        plan_items.append({"course_id": c.course_id, "why": why_message, "citations": draft.citations})
 
-    return AdviseResponse(
+    resp = AdviseResponse(
         plan=[PlanItem(**p) for p in plan_items],
         gap_map=gap_map,
-        timeline=Timeline(weeks=total_weeks, sequence=seq),
-        notes="Path maximizes JD coverage with minimal prereqs; PDF available via /plan/pdf (see docs).",
-        metrics={"coverage": round(coverage,3), "diversity": round(diversity,3)}
+        timeline=Timeline(weeks=draft.weeks, sequence=draft.sequence),
+        notes=PLAN_NOTES,
+        metrics={"coverage": round(draft.coverage,3), "diversity": round(draft.diversity,3)}
     )
+    resp.plan_id = plan_digest(**_pdf_args(goal_role, resp))[:24]
+    plan_store.put(resp.plan_id, (goal_role, resp))
+    return resp
 
-# ... (keep the /plan/pdf endpoint as it is)
-@app.post("/plan/pdf")
-def plan_pdf(req: AdviseRequest):
-    # Reuse advise() to compute the plan; if advise raises, middleware will handle it
-    plan = advise(req)
+@app.post("/advise", response_model=AdviseResponse)
+async def advise(req: AdviseRequest):
+    deadline = plan_deadline()
+    # 1-2) Safety, JD, gaps
+    jd, gap_map = prepare_request(req)
+    # identical requests already in flight share that computation (and its deadline)
+    with profiling.span("advise"):
+        return await advise_flight.do(_plan_key(jd, gap_map), lambda: _advise(jd, gap_map, deadline))
 
-    # Create a temp file path safely
-    fd, path = tempfile.mkstemp(prefix="upskill_plan_", suffix=".pdf")
-    os.close(fd)  # close the OS handle; ReportLab will open by path
+async def _advise(jd: JD, gap_map: Dict[str, int], deadline: Optional[float]) -> AdviseResponse:
+    # 3-7) Retrieval, rerank, path, timeline & metrics (memoized per gap signature)
+    draft = await abuild_plan(jd, gap_map, deadline)
 
-    render_plan_pdf(
-        path=path,
+    # --- STEP 8 IS NOW MODIFIED ---
+    # 8) LLM to generate "why" messages via Google Gemini
+    # All courses are explained concurrently under one LLM_DEADLINE_SEC budget;
+    # stragglers fall back to the deterministic template.
+    whys = await llm.agenerate_explanations(draft.chosen, jd.role, gap_map)
+    return make_response(jd.role, gap_map, draft, whys)
+
+def plan_skeleton(gap_map: Dict[str, int], draft: PlanDraft) -> Dict:
+    """Everything in an AdviseResponse except the LLM text (and the plan_id, which hashes it)."""
+    return {
+        "plan": [{"course_id": c.course_id, "title": c.title, "why": None, "citations": draft.citations}
+                 for c in draft.chosen],
+        "gap_map": gap_map,
+        "timeline": {"weeks": draft.weeks, "sequence": draft.sequence},
+        "notes": PLAN_NOTES,
+        "metrics": {"coverage": round(draft.coverage,3), "diversity": round(draft.diversity,3)},
+    }
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {data if isinstance(data, str) else json.dumps(data)}\n\n"
+
+@app.post("/advise/stream")
+async def advise_stream(req: AdviseRequest):
+    """/advise as server-sent events: `plan` (skeleton, no why text), one `why`
+    per course as its explanation lands, then `done` with the full AdviseResponse."""
+    deadline = plan_deadline()
+    # validation errors surface as normal HTTP errors, before the stream opens
+    jd, gap_map = prepare_request(req)
+    goal_role = req.profile.goal_role
+
+    async def events():
+        try:
+            draft = await abuild_plan(jd, gap_map, deadline)
+            yield _sse("plan", plan_skeleton(gap_map, draft))
+            whys: List[str] = [""] * len(draft.chosen)
+            async for i, text, source in llm.astream_explanations(draft.chosen, goal_role, gap_map):
+                whys[i] = text
+                yield _sse("why", {"index": i, "course_id": draft.chosen[i].course_id, "why": text, "source": source})
+            yield _sse("done", make_response(goal_role, gap_map, draft, whys).model_dump_json())
+        except Exception as e:
+            # headers are already sent; report in-band
+            log.error("advise_stream_error", err=str(e))
+            metrics.error()     # the response itself went out as a 200
+            yield _sse("error", {"detail": "internal error"})
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+def advise_sync(req: AdviseRequest) -> AdviseResponse:
+    """Blocking /advise for scripts and worker threads (no event loop needed)."""
+    deadline = plan_deadline()
+    jd, gap_map = prepare_request(req)
+    draft = build_plan(jd, gap_map, deadline)
+    whys = llm.generate_explanations(draft.chosen, req.profile.goal_role, gap_map)
+    return make_response(req.profile.goal_role, gap_map, draft, whys)
+
+def advise_batch(reqs: List[AdviseRequest],
+                 llm_executor: Optional[ThreadPoolExecutor] = None) -> Iterator[Union[AdviseResponse, Dict]]:
+    """Python API behind /advise/batch: yields one result per request, in input order.
+
+    Failed items yield {"error": detail, "status": code} instead of raising.
+    Work is done in chunks of BATCH_CHUNK_SIZE so memory stays bounded.
+    `llm_executor` replaces the shared LLM pool for the explanations.
+    """
+    size = max(1, settings.BATCH_CHUNK_SIZE)
+    for start in range(0, len(reqs), size):
+        chunk = reqs[start:start + size]
+        prepared: List[Union[Tuple[JD, Dict[str, int]], HTTPException]] = []
+        for r in chunk:
+            try:
+                prepared.append(prepare_request(r))
+            except HTTPException as e:
+                prepared.append(e)
+        ok = [p for p in prepared if not isinstance(p, HTTPException)]
+        drafts = build_plans(ok)
+        whys = iter(llm.generate_explanations_many(
+            [(d.chosen, jd.role, gaps) for d, (jd, gaps) in zip(drafts, ok)], executor=llm_executor))
+        plans = iter(drafts)
+        for p in prepared:
+            if isinstance(p, HTTPException):
+                yield {"error": p.detail, "status": p.status_code}
+            else:
+                yield make_response(p[0].role, p[1], next(plans), next(whys))
+
+@app.post("/advise/batch")
+def advise_batch_endpoint(reqs: List[AdviseRequest]):
+    """NDJSON stream: one AdviseResponse (or error object) per line, in input order."""
+    def lines():
+        for res in advise_batch(reqs):
+            yield (res.model_dump_json() if isinstance(res, AdviseResponse) else json.dumps(res)) + "\n"
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+def _pdf_args(goal_role: str, plan: AdviseResponse) -> Dict:
+    return dict(
         name="Candidate",
-        goal=req.profile.goal_role,
+        goal=goal_role,
         plan=[p.model_dump() for p in plan.plan],
         gap_map=plan.gap_map,
-        timeline=plan.timeline.model_dump()
+        timeline=plan.timeline.model_dump(),
     )
 
-    # Let FastAPI serve & handle cleanup (you can delete later if needed)
-    return FileResponse(path, media_type="application/pdf",filename="upskill_plan.pdf")
\ No newline at end of file
+def plan_pdf_bytes(goal_role: str, plan: AdviseResponse) -> bytes:
+    """Rendered PDF for a plan, from the content-addressed cache when possible."""
+    args = _pdf_args(goal_role, plan)
+    key = plan.plan_id or plan_digest(**args)[:24]
+    pdf = pdf_cache.get(key)
+    if pdf is None:
+        with metrics.timer("pdf"):
+            pdf = render_plan_pdf_bytes(**args)
+        pdf_cache.put(key, pdf)
+    return pdf
+
+def _pdf_response(pdf: bytes) -> Response:
+    # rendered in memory; nothing is left behind in /tmp
+    return Response(pdf, media_type="application/pdf",
+                    headers={"Content-Disposition": 'attachment; filename="upskill_plan.pdf"'})
+
+@app.post("/plan/pdf")
+async def plan_pdf(req: AdviseRequest):
+    # Reuse advise() to compute the plan; if advise raises, middleware will handle it
+    plan = await advise(req)
+    return _pdf_response(await offload(plan_pdf_bytes, req.profile.goal_role, plan))
+
+@app.get("/plan/{plan_id}/pdf")
+async def plan_pdf_by_id(plan_id: str):
+    # PDF for a plan already returned by /advise, without recomputing it
+    entry = plan_store.get(plan_id)
+    if entry is None:
+        raise HTTPException(404, "plan not found or expired; POST /plan/pdf instead")
+    goal_role, plan = entry
+    return _pdf_response(await offload(plan_pdf_bytes, goal_role, plan))
+
+@app.post("/exports", status_code=202)
+async def create_export(request: Request, format: str = "zip"):
+    """Starts a cohort export. Body: NDJSON, one AdviseRequest (plus optional "name") per line."""
+    _require_ready()
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(400, f"format must be one of {', '.join(EXPORT_FORMATS)}")
+    job = exports.create(format)
+    limit, size = settings.EXPORT_MAX_UPLOAD_MB * 1024 * 1024, 0
+    try:
+        # spooled to disk as it arrives; the cohort is never held in memory
+        with open(job.source, "wb") as f:
+            async for chunk in request.stream():
+                size += len(chunk)
+                if size > limit:
+                    raise HTTPException(413, f"cohort larger than {settings.EXPORT_MAX_UPLOAD_MB} MB")
+                await offload(f.write, chunk)
+    except BaseException:
+        exports.delete(job.id)
+        raise
+    exports.start(job)
+    # the token is only ever returned here; every later call on the job needs it
+    return JSONResponse({**job.to_dict(), "token": job.token}, status_code=202,
+                        headers={"Location": f"/exports/{job.id}"})
+
+def _export_job(job_id: str, token: str, admin_token: str = ""):
+    job = exports.get(job_id)
+    # a wrong token looks like a missing job
+    if job is None or not (job.owned_by(token) or _admin_ok(admin_token)):
+        raise HTTPException(404, "export not found or expired")
+    return job
+
+@app.get("/exports")
+def list_exports(x_admin_token: str = Header("")):
+    _require_admin(x_admin_token)
+    return {"jobs": [j.to_dict() for j in exports.jobs()]}
+
+@app.get("/exports/{job_id}")
+def get_export(job_id: str, token: str = "", x_export_token: str = Header(""), x_admin_token: str = Header("")):
+    return _export_job(job_id, x_export_token or token, x_admin_token).to_dict()
+
+@app.get("/exports/{job_id}/download")
+def download_export(job_id: str, token: str = "", x_export_token: str = Header(""), x_admin_token: str = Header("")):
+    job = _export_job(job_id, x_export_token or token, x_admin_token)
+    if job.status != "done":
+        raise HTTPException(409, f"export is {job.status}", headers={"Retry-After": "5"})
+    # streamed from disk in chunks
+    media_type = "application/zip" if job.format == "zip" else "application/pdf"
+    return FileResponse(job.result, media_type=media_type, filename=f"cohort_plans_{job.id[:8]}.{job.format}")
+
+@app.delete("/exports/{job_id}")
+def delete_export(job_id: str, token: str = "", x_export_token: str = Header(""), x_admin_token: str = Header("")):
+    """Cancels a queued or running export and removes its files."""
+    job = exports.delete(_export_job(job_id, x_export_token or token, x_admin_token).id)
+    if job is None:
+        raise HTTPException(404, "export not found or expired")
+    return {"job_id": job.id, "deleted": True}
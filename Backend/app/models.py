@@ -1,4 +1,4 @@
-from typing import List, Dict
+from typing import List, Dict, Tuple
 from dataclasses import dataclass
 
 @dataclass
@@ -7,3 +7,16 @@ class RetrievedDoc:
     text: str
     meta: Dict
     score: float
+
+
+@dataclass(frozen=True)
+class PlanDraft:
+    """Deterministic part of an /advise plan (everything but the LLM text)."""
+    query: str
+    chosen: List            # List[Course], in timeline order
+    weeks: int
+    sequence: List[Tuple[str, int, int]]
+    coverage: float
+    diversity: float
+    citations: List[Dict]
+    degraded: bool = False  # rerank truncated/skipped by the latency budget; not cached
@@ -0,0 +1,238 @@
+# app/retrieval/artifacts.py
+"""Versioned on-disk retrieval artifacts (built by `python -m app.cli build-index`).
+
+    INDEX_DIR/<content hash[:16]>/
+        manifest.json        content hash, sizes, embedding signature
+        docs.jsonl           {"id", "text", "meta"} per row, in matrix order
+        embeddings.npy       float32 (n_docs, dim), L2-normalized
+        embeddings_int8.npy, embeddings_scale.npy, embeddings_float16.npy
+                             quantized copies for DENSE_QUANTIZATION
+        bm25_*.npy           CSR postings (weights and raw tf), idf, doc lengths
+        bm25_vocab.json      term -> postings row
+    INDEX_DIR/CURRENT        name of the live version
+    INDEX_DIR/.lock          held while a version is checked and built
+
+Arrays are opened with mmap_mode="r", so all workers on a node share one
+page-cache copy instead of each holding (and computing) its own. When the
+catalog changed, the first worker to take the lock builds the new version;
+the others wait, find it and map it.
+"""
+import hashlib, json, os, shutil, tempfile, time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+import numpy as np
+import structlog
+from langchain_core.embeddings import Embeddings
+from app.retrieval.bm25_index import BM25Index
+from app.retrieval.local_index import QUANT_KINDS, _normalize, quantize_rows
+from app.retrieval.vector import doc_id
+
+try:
+    import fcntl
+except ImportError:     # Windows: no cross-process lock, builds may overlap
+    fcntl = None
+
+log = structlog.get_logger()
+
+FORMAT = 1
+_BM25_ARRAYS = ("indptr", "indices", "weights", "tf", "doc_len", "idf")
+
+
+def content_hash(docs: List[Dict], signature: str) -> str:
+    """Changes whenever a doc, the doc order or the embedding model changes."""
+    h = hashlib.sha256(f"{FORMAT}|{signature}".encode())
+    for d in docs:
+        h.update(json.dumps([d["text"], d["meta"]], sort_keys=True, separators=(",", ":")).encode())
+        h.update(b"\n")
+    return h.hexdigest()
+
+
+def current(index_dir: str) -> Optional[str]:
+    """Path of the live version, if any."""
+    try:
+        with open(os.path.join(index_dir, "CURRENT")) as f:
+            path = os.path.join(index_dir, f.read().strip())
+    except FileNotFoundError:
+        return None
+    return path if os.path.exists(os.path.join(path, "manifest.json")) else None
+
+
+def _set_current(index_dir: str, name: str) -> None:
+    tmp = os.path.join(index_dir, f".CURRENT.{os.getpid()}")
+    with open(tmp, "w") as f:
+        f.write(name)
+    os.replace(tmp, os.path.join(index_dir, "CURRENT"))
+
+
+def _read_manifest(path: str) -> Dict:
+    with open(os.path.join(path, "manifest.json")) as f:
+        return json.load(f)
+
+
+def _read_docs(path: str) -> List[Dict]:
+    with open(os.path.join(path, "docs.jsonl")) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+@contextmanager
+def _locked(index_dir: str):
+    """Exclusive lock on INDEX_DIR/.lock (workers and build-index on one node)."""
+    os.makedirs(index_dir, exist_ok=True)
+    with open(os.path.join(index_dir, ".lock"), "a") as f:
+        if fcntl is not None:
+            t0 = time.perf_counter()
+            fcntl.flock(f, fcntl.LOCK_EX)
+            waited = time.perf_counter() - t0
+            if waited > 0.5:
+                log.info("index_lock_waited", index_dir=index_dir, sec=round(waited, 3))
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _reusable_vectors(index_dir: str, signature: str) -> Dict[tuple, np.ndarray]:
+    """(id, text) -> vector from the live version, if it used the same model."""
+    prev = current(index_dir)
+    if prev is None or _read_manifest(prev).get("embedding") != signature:
+        return {}
+    matrix = np.load(os.path.join(prev, "embeddings.npy"), mmap_mode="r")
+    return {(d["id"], d["text"]): matrix[i] for i, d in enumerate(_read_docs(prev))}
+
+
+def build(index_dir: str, docs: List[Dict], embeddings: Embeddings, signature: str,
+          force: bool = False) -> Dict:
+    """Compile docs into INDEX_DIR/<hash> and point CURRENT at it.
+
+    Nothing is embedded when the content hash already has a build; otherwise
+    only docs whose text changed since the live version are embedded.
+    """
+    with _locked(index_dir):
+        return _build(index_dir, docs, embeddings, signature, force)
+
+
+def _build(index_dir: str, docs: List[Dict], embeddings: Embeddings, signature: str, force: bool) -> Dict:
+    digest = content_hash(docs, signature)
+    name = digest[:16]
+    path = os.path.join(index_dir, name)
+    if os.path.exists(os.path.join(path, "manifest.json")) and not force:
+        _set_current(index_dir, name)
+        return {**_read_manifest(path), "path": path, "skipped": True}
+
+    t0 = time.perf_counter()
+    ids = [doc_id(d["meta"]) for d in docs]
+    reuse = {} if force else _reusable_vectors(index_dir, signature)
+    todo = [i for i, (i_d, d) in enumerate(zip(ids, docs)) if (i_d, d["text"]) not in reuse]
+    fresh = np.asarray(embeddings.embed_documents([docs[i]["text"] for i in todo]), dtype=np.float32)
+    dim = fresh.shape[1] if len(todo) else len(next(iter(reuse.values()), ()))
+    matrix = np.empty((len(docs), dim), dtype=np.float32)
+    if todo:
+        matrix[todo] = _normalize(fresh)
+    for i, (i_d, d) in enumerate(zip(ids, docs)):
+        if (i_d, d["text"]) in reuse:
+            matrix[i] = reuse[(i_d, d["text"])]
+
+    from app.retrieval.bm25 import _tokenize
+    bm25 = BM25Index([_tokenize(d["text"]) for d in docs])
+
+    tmp = tempfile.mkdtemp(prefix=".build-", dir=index_dir)
+    np.save(os.path.join(tmp, "embeddings.npy"), matrix)
+    for kind in QUANT_KINDS:
+        codes, scales = quantize_rows(matrix, kind)
+        np.save(os.path.join(tmp, f"embeddings_{kind}.npy"), codes)
+        if scales is not None:
+            np.save(os.path.join(tmp, "embeddings_scale.npy"), scales)
+    for key, arr in bm25.arrays().items():
+        np.save(os.path.join(tmp, f"bm25_{key}.npy"), np.ascontiguousarray(arr))
+    with open(os.path.join(tmp, "bm25_vocab.json"), "w") as f:
+        json.dump(bm25.vocab, f)
+    with open(os.path.join(tmp, "docs.jsonl"), "w") as f:
+        for i_d, d in zip(ids, docs):
+            f.write(json.dumps({"id": i_d, "text": d["text"], "meta": d["meta"]}) + "\n")
+    manifest = {
+        "format": FORMAT,
+        "hash": digest,
+        "embedding": signature,
+        "n_docs": len(docs),
+        "dim": dim,
+        "bm25": {"k1": bm25.k1, "b": bm25.b, "epsilon": bm25.epsilon, "vocab": len(bm25.vocab)},
+        "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    }
+    with open(os.path.join(tmp, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    try:
+        os.rename(tmp, path)
+    except OSError:
+        # another worker published the same hash first; theirs is identical
+        shutil.rmtree(tmp, ignore_errors=True)
+    _set_current(index_dir, name)
+    log.info("index_built", path=path, docs=len(docs), embedded=len(todo),
+             reused=len(docs) - len(todo), sec=round(time.perf_counter() - t0, 3))
+    return {**manifest, "path": path, "skipped": False, "embedded": len(todo)}
+
+
+@dataclass
+class Artifacts:
+    path: str
+    manifest: Dict
+    docs: List[Dict]            # {"id", "text", "meta"} per row
+    matrix: np.ndarray          # read-only memmap
+    bm25: BM25Index             # over read-only memmaps
+
+    @property
+    def ids(self) -> List[str]:
+        return [d["id"] for d in self.docs]
+
+    def quantized(self, kind: str):
+        """Memory-mapped (codes, scales) for kind, or None if this build predates them."""
+        path = os.path.join(self.path, f"embeddings_{kind}.npy")
+        if not os.path.exists(path):
+            return None
+        scales = os.path.join(self.path, "embeddings_scale.npy") if kind == "int8" else None
+        return np.load(path, mmap_mode="r"), (np.load(scales, mmap_mode="r") if scales else None)
+
+    def synced_to(self, target: str) -> bool:
+        return os.path.exists(os.path.join(self.path, f"synced-{target}"))
+
+    def mark_synced(self, target: str) -> None:
+        with open(os.path.join(self.path, f"synced-{target}"), "w") as f:
+            f.write(time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()))
+
+
+def load(path: str) -> Artifacts:
+    manifest = _read_manifest(path)
+    if manifest.get("format") != FORMAT:
+        raise ValueError(f"unsupported index format {manifest.get('format')} in {path}")
+    arrays = {k: np.load(os.path.join(path, f"bm25_{k}.npy"), mmap_mode="r") for k in _BM25_ARRAYS}
+    with open(os.path.join(path, "bm25_vocab.json")) as f:
+        vocab = json.load(f)
+    p = manifest["bm25"]
+    return Artifacts(
+        path=path,
+        manifest=manifest,
+        docs=_read_docs(path),
+        matrix=np.load(os.path.join(path, "embeddings.npy"), mmap_mode="r"),
+        bm25=BM25Index.from_arrays(vocab, arrays, k1=p["k1"], b=p["b"], epsilon=p["epsilon"]),
+    )
+
+
+def ensure(index_dir: str, docs: List[Dict], embeddings: Embeddings, signature: str) -> Artifacts:
+    """Artifacts for exactly these docs: the live version if its hash matches, else a fresh build.
+
+    Only one process builds: the others block on the lock, then find the
+    version it published and map it without embedding anything.
+    """
+    digest = content_hash(docs, signature)
+    live = current(index_dir)
+    if live is not None and _read_manifest(live).get("hash") == digest:
+        return load(live)
+    with _locked(index_dir):
+        live = current(index_dir)
+        if live is not None and _read_manifest(live).get("hash") == digest:
+            return load(live)
+        return load(_build(index_dir, docs, embeddings, signature, force=False)["path"])
@@ -1,10 +1,12 @@
 # app/retrieval/bm25.py
-from typing import List, Dict
+from typing import Iterable, List, Dict
 from dataclasses import dataclass
-from rank_bm25 import BM25Okapi
+import numpy as np
 from langchain_core.documents import Document
 from langchain_core.retrievers import BaseRetriever
 from langchain_core.pydantic_v1 import PrivateAttr  # <-- pydantic v1 private attr
+from app.retrieval.bm25_index import BM25Index, BM25Hit
+from app.retrieval.vector import doc_id
 
 def _tokenize(text: str) -> List[str]:
     return text.lower().split()
@@ -12,7 +14,7 @@ def _tokenize(text: str) -> List[str]:
 @dataclass
 class _BM25Store:
     docs: List[Document]
-    bm25: BM25Okapi
+    bm25: BM25Index
 
 class SimpleBM25Retriever(BaseRetriever):
     """Minimal BM25 retriever compatible with LangChain BaseRetriever."""
@@ -25,18 +27,39 @@ class SimpleBM25Retriever(BaseRetriever):
 
     def _build(self, docs: List[Document]) -> _BM25Store:
         tokenized = [_tokenize(d.page_content) for d in docs]
-        return _BM25Store(docs=docs, bm25=BM25Okapi(tokenized))
+        return _BM25Store(docs=docs, bm25=BM25Index(tokenized))
 
-    def _get_relevant_documents(self, query: str) -> List[Document]:
-        scores = self._store.bm25.get_scores(_tokenize(query))
-        ranked = sorted(zip(self._store.docs, scores), key=lambda x: x[1], reverse=True)[: self.k]
-        out = []
-        for d, s in ranked:
-            md = dict(d.metadata)
-            md["bm25_score"] = float(s)
-            out.append(Document(page_content=d.page_content, metadata=md))
+    @classmethod
+    def from_index(cls, docs: List[Document], bm25: BM25Index, k: int = 20) -> "SimpleBM25Retriever":
+        """Wrap a prebuilt (e.g. memory-mapped) index; docs[i] must be row i."""
+        out = cls.__new__(cls)
+        BaseRetriever.__init__(out, k=k)
+        out._store = _BM25Store(docs=docs, bm25=bm25)
         return out
 
+    @property
+    def docs(self) -> List[Document]:
+        return self._store.docs
+
+    def with_changes(self, upserts: List[Document], deletes: Iterable[str] = ()) -> "SimpleBM25Retriever":
+        """Copy with docs replaced/added (matched by doc_id) and deleted; only
+        the changed docs are tokenized. The current retriever is not modified."""
+        drop = set(deletes) | {doc_id(d.metadata) for d in upserts}
+        keep = [i for i, d in enumerate(self._store.docs) if doc_id(d.metadata) not in drop]
+        bm25 = self._store.bm25.with_changes(np.asarray(keep, dtype=np.int64),
+                                             [_tokenize(d.page_content) for d in upserts])
+        return SimpleBM25Retriever.from_index([self._store.docs[i] for i in keep] + list(upserts), bm25, k=self.k)
+
+    def search(self, query: str, k: int = None) -> List[BM25Hit]:
+        """Top-k (doc index, score) hits; only docs sharing a query term are scored."""
+        return self._store.bm25.search(_tokenize(query), self.k if k is None else k)
+
+    def _get_relevant_documents(self, query: str) -> List[Document]:
+        # shared, read-only Document objects; scores are available via search()
+        return [self._store.docs[h.index] for h in self.search(query)]
+
+def to_documents(docs: List[Dict]) -> List[Document]:
+    return [Document(page_content=d["text"], metadata=d["meta"]) for d in docs]
+
 def build_bm25(docs: List[Dict]) -> SimpleBM25Retriever:
-    lc_docs = [Document(page_content=d["text"], metadata=d["meta"]) for d in docs]
-    return SimpleBM25Retriever(lc_docs, k=20)
+    return SimpleBM25Retriever(to_documents(docs), k=20)
@@ -0,0 +1,131 @@
+# app/retrieval/bm25_index.py
+from typing import Dict, Iterable, List, NamedTuple
+from collections import Counter
+import numpy as np
+from scipy import sparse
+from app.retrieval.local_index import top_k
+
+
+class BM25Hit(NamedTuple):
+    index: int      # position of the doc in the indexed corpus
+    score: float
+
+
+def _count(corpus: Iterable[List[str]], vocab: Dict[str, int]):
+    """COO triplets (term, doc, tf) and doc lengths; new terms are added to vocab."""
+    rows, cols, tfs, doc_len = [], [], [], []
+    for d, tokens in enumerate(corpus):
+        doc_len.append(len(tokens))
+        for term, tf in Counter(tokens).items():
+            rows.append(vocab.setdefault(term, len(vocab)))
+            cols.append(d)
+            tfs.append(tf)
+    return rows, cols, tfs, doc_len
+
+
+class BM25Index:
+    """Okapi BM25 over a CSR term-document matrix (rows = terms, cols = docs).
+
+    Each row is the posting list of one term with its BM25 weight precomputed,
+    so a query only touches docs that contain at least one of its terms.
+    Scoring matches rank_bm25.BM25Okapi (same idf floor, k1, b, epsilon).
+    """
+
+    def __init__(self, corpus: Iterable[List[str]], k1: float = 1.5, b: float = 0.75, epsilon: float = 0.25):
+        self.k1, self.b, self.epsilon = k1, b, epsilon
+        vocab: Dict[str, int] = {}
+        rows, cols, tfs, doc_len = _count(corpus, vocab)
+        tf = sparse.csr_matrix(
+            (np.asarray(tfs, dtype=np.float32), (np.asarray(rows, dtype=np.int64), np.asarray(cols, dtype=np.int64))),
+            shape=(len(vocab), len(doc_len)),
+        )
+        self._set(vocab, tf, np.asarray(doc_len, dtype=np.float32))
+
+    def _set(self, vocab: Dict[str, int], tf: sparse.csr_matrix, doc_len: np.ndarray) -> None:
+        tf.sort_indices()
+        self.vocab = vocab
+        self.tf = tf                      # raw term frequencies, kept for incremental updates
+        self.n_docs = len(doc_len)
+        self.doc_len = doc_len
+        self.idf = self._idf(np.diff(tf.indptr))
+        self.postings = self._weigh(tf)
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        """Everything but the vocab needed to restore the index (see from_arrays)."""
+        p = self.postings
+        return {"indptr": p.indptr, "indices": p.indices, "weights": p.data,
+                "tf": self.tf.data, "doc_len": self.doc_len, "idf": self.idf}
+
+    @classmethod
+    def from_arrays(cls, vocab: Dict[str, int], arrays: Dict[str, np.ndarray],
+                    k1: float = 1.5, b: float = 0.75, epsilon: float = 0.25) -> "BM25Index":
+        """Restore an index saved via arrays(); the arrays are used as-is (no
+        copy), so memory-mapped files stay shared between processes."""
+        out = cls.__new__(cls)
+        out.k1, out.b, out.epsilon = k1, b, epsilon
+        out.vocab = vocab
+        out.doc_len, out.idf = arrays["doc_len"], arrays["idf"]
+        out.n_docs = len(out.doc_len)
+        shape = (len(vocab), out.n_docs)
+        structure = (arrays["indices"], arrays["indptr"])
+        out.tf = sparse.csr_matrix((arrays["tf"], *structure), shape=shape, copy=False)
+        out.postings = sparse.csr_matrix((arrays["weights"], *structure), shape=shape, copy=False)
+        return out
+
+    def with_changes(self, keep: np.ndarray, added: Iterable[List[str]]) -> "BM25Index":
+        """New index over docs[keep] (in that order) followed by `added`.
+
+        Kept docs are not re-tokenized: their term counts are sliced out of
+        the existing matrix; only idf and the weights are recomputed, since
+        both depend on the whole corpus. self is left untouched, so readers
+        can keep using it until the caller swaps the new index in.
+        """
+        vocab = dict(self.vocab)
+        rows, cols, tfs, new_len = _count(added, vocab)
+        kept = self.tf[:, np.asarray(keep, dtype=np.int64)].tocoo()
+        n_keep = kept.shape[1]
+        tf = sparse.csr_matrix(
+            (np.concatenate([kept.data, np.asarray(tfs, dtype=np.float32)]),
+             (np.concatenate([kept.row, np.asarray(rows, dtype=np.int64)]),
+              np.concatenate([kept.col, n_keep + np.asarray(cols, dtype=np.int64)]))),
+            shape=(len(vocab), n_keep + len(new_len)),
+        )
+        # drop terms no remaining doc uses so idf stats match a fresh build
+        alive = np.flatnonzero(np.diff(tf.indptr))
+        if len(alive) < len(vocab):
+            terms = list(vocab)
+            vocab = {terms[r]: i for i, r in enumerate(alive)}
+            tf = tf[alive]
+        out = BM25Index.__new__(BM25Index)
+        out.k1, out.b, out.epsilon = self.k1, self.b, self.epsilon
+        doc_len = np.concatenate([self.doc_len[np.asarray(keep, dtype=np.int64)], np.asarray(new_len, dtype=np.float32)])
+        out._set(vocab, tf, doc_len.astype(np.float32))
+        return out
+
+    def _idf(self, df: np.ndarray) -> np.ndarray:
+        if not len(df):
+            return np.zeros(0, dtype=np.float32)
+        idf = np.log(self.n_docs - df + 0.5) - np.log(df + 0.5)
+        # same floor as BM25Okapi: negative idfs become epsilon * mean idf
+        idf[idf < 0] = self.epsilon * idf.mean()
+        return idf.astype(np.float32)
+
+    def _weigh(self, tf: sparse.csr_matrix) -> sparse.csr_matrix:
+        avgdl = self.doc_len.sum() / max(1, self.n_docs)
+        norm = self.k1 * (1 - self.b + self.b * self.doc_len / max(avgdl, 1e-9))
+        term_of = np.repeat(np.arange(tf.shape[0]), np.diff(tf.indptr))
+        f = tf.data
+        w = self.idf[term_of] * (f * (self.k1 + 1) / (f + norm[tf.indices]))
+        return sparse.csr_matrix((w.astype(np.float32), tf.indices, tf.indptr), shape=tf.shape)
+
+    def search(self, tokens: List[str], k: int) -> List[BM25Hit]:
+        rows = [self.vocab[t] for t in tokens if t in self.vocab]
+        if not rows or k <= 0:
+            return []
+        p = self.postings
+        docs = np.concatenate([p.indices[p.indptr[r]:p.indptr[r + 1]] for r in rows])
+        weights = np.concatenate([p.data[p.indptr[r]:p.indptr[r + 1]] for r in rows])
+        cand, inv = np.unique(docs, return_inverse=True)
+        scores = np.bincount(inv, weights=weights)
+        idx, top = top_k(scores[None, :], k)
+        return [BM25Hit(int(cand[i]), float(s)) for i, s in zip(idx[0], top[0])]
@@ -1,29 +1,194 @@
 # app/retrieval/hybrid.py
-from typing import List, Dict
+import asyncio, threading, time
+from collections import defaultdict
+from concurrent.futures import Executor
+from typing import Any, Iterable, List, Dict, Optional, Tuple
 from app.models import RetrievedDoc
 from app.config import settings
-from langchain.retrievers import EnsembleRetriever
-from sentence_transformers import CrossEncoder  # reranker. :contentReference[oaicite:14]{index=14}
+from app.retrieval.vector import doc_id
+from app.services.cache import LRUCache
+from app.services import profiling
+from app.services.inference import PooledCrossEncoder, get_pool
+from app.services.metrics import metrics
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+# One warm cross-encoder per process; loading weights dominates per-request cost.
+_cross_encoder = None
+_cross_encoder_lock = threading.Lock()
+# (query, doc id) -> cross-encoder score
+pair_scores = LRUCache(settings.RERANK_CACHE_SIZE)
+# EWMA of cross-encoder seconds per uncached pair; drives the latency budget
+_pair_cost = 0.0
+
+class HybridRetriever(BaseRetriever):
+    """Dense + BM25 legs fused with weighted reciprocal rank fusion.
+
+    Docs are deduplicated by doc id (kind + source_id), so a course found by
+    both legs appears once with both contributions summed. top_k caps the
+    fused list (0 = keep everything the legs returned).
+    """
+    retrievers: List[Any]
+    weights: List[float]
+    c: int = 60
+    top_k: int = 0
+
+    def fuse(self, doc_lists: List[List[Document]]) -> List[Tuple[Document, float]]:
+        scores: Dict[str, float] = defaultdict(float)
+        first: Dict[str, Document] = {}
+        for docs, weight in zip(doc_lists, self.weights):
+            for rank, doc in enumerate(docs, start=1):
+                key = doc_id(doc.metadata) if "source_id" in doc.metadata else doc.page_content
+                scores[key] += weight / (rank + self.c)
+                first.setdefault(key, doc)
+        # stable sort: ties keep first-seen order (dense leg first)
+        fused = sorted(first, key=scores.__getitem__, reverse=True)
+        if self.top_k:
+            fused = fused[:self.top_k]
+        return [(first[k], scores[k]) for k in fused]
+
+    def weighted_reciprocal_rank(self, doc_lists: List[List[Document]]) -> List[Document]:
+        return [d for d, _ in self.fuse(doc_lists)]
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        return self.weighted_reciprocal_rank([r.invoke(query) for r in self.retrievers])
 
 def build_hybrid_retriever(bm25_retriever, vectorstore):
     dense = vectorstore.as_retriever(search_kwargs={"k": settings.TOP_K_VECTOR})
     bm25_retriever.k = settings.TOP_K_BM25
-    # Ensemble fusion (weighted sum). 
-    return EnsembleRetriever(retrievers=[dense, bm25_retriever], weights=[0.5, 0.5])
-
-def rerank(query: str, docs, topn: int = 10) -> List[RetrievedDoc]:
-    # Cross-encoder scores the pair (query, doc)
-    model = CrossEncoder(settings.CROSS_ENCODER_MODEL)
-    pairs = [(query, d.page_content) for d in docs]
-    scores = model.predict(pairs)
-    ranked = sorted(zip(docs, scores), key=lambda x: x[1], reverse=True)[:topn]
-    out: List[RetrievedDoc] = []
-    for doc, s in ranked:
-        meta = dict(doc.metadata)
-        out.append(RetrievedDoc(
-            source_id=meta.get("source_id", ""),
-            text=doc.page_content,
-            meta=meta,
-            score=float(s)
-        ))
-    return out
+    # Native RRF fusion (dense, bm25)
+    return HybridRetriever(retrievers=[dense, bm25_retriever], weights=[0.5, 0.5], top_k=settings.FUSION_TOPK)
+
+class OverlapReranker:
+    """Model-free stand-in for the cross-encoder (RERANKER_BACKEND=overlap):
+    scores a pair by the share of query tokens found in the doc."""
+
+    def predict(self, pairs, batch_size: int = 32, **kwargs):
+        out = []
+        for q, d in pairs:
+            qt, dt = set(q.lower().split()), set(d.lower().split())
+            out.append(len(qt & dt) / max(1, len(qt)))
+        return out
+
+def get_cross_encoder():
+    global _cross_encoder
+    if _cross_encoder is None:
+        with _cross_encoder_lock:
+            if _cross_encoder is None:
+                pool = get_pool()
+                if pool is not None:
+                    _cross_encoder = PooledCrossEncoder(pool)  # micro-batched across requests
+                elif settings.RERANKER_BACKEND == "overlap":
+                    _cross_encoder = OverlapReranker()
+                else:
+                    from sentence_transformers import CrossEncoder  # reranker. :contentReference[oaicite:14]{index=14}
+                    _cross_encoder = CrossEncoder(settings.CROSS_ENCODER_MODEL)
+    return _cross_encoder
+
+def calibrate_reranker(n_pairs: int = 16) -> float:
+    """Seed the per-pair cost estimate so the latency budget works from the first request."""
+    global _pair_cost
+    pairs = [("calibration query about python testing", "a short course description " * 8)] * n_pairs
+    t0 = time.perf_counter()
+    get_cross_encoder().predict(pairs, batch_size=settings.RERANK_BATCH_SIZE)
+    _pair_cost = (time.perf_counter() - t0) / n_pairs
+    return _pair_cost
+
+def _leg(name: str, retriever, query: str) -> List[Document]:
+    with metrics.timer(name):
+        return retriever.invoke(query)
+
+def _fuse(hybrid, doc_lists: List[List[Document]]) -> List[Document]:
+    with metrics.timer("fusion"):
+        return hybrid.weighted_reciprocal_rank(doc_lists)
+
+def retrieve(hybrid, query: str) -> List[Document]:
+    """Same result as hybrid.invoke(query), with each leg timed separately."""
+    dense, bm25 = hybrid.retrievers
+    return _fuse(hybrid, [_leg("dense", dense, query), _leg("bm25", bm25, query)])
+
+async def aretrieve(hybrid, query: str, executor: Optional[Executor] = None) -> List[Document]:
+    """Run the dense and BM25 legs concurrently off the event loop, then fuse."""
+    loop = asyncio.get_running_loop()
+    dense, bm25 = hybrid.retrievers
+    legs = [loop.run_in_executor(executor, profiling.bind(_leg), "dense", dense, query),
+            loop.run_in_executor(executor, profiling.bind(_leg), "bm25", bm25, query)]
+    return _fuse(hybrid, list(await asyncio.gather(*legs)))
+
+def retrieve_many(hybrid, queries: List[str]) -> List[List[Document]]:
+    """Hybrid retrieval for many queries; the dense leg embeds them in one batch."""
+    dense, bm25 = hybrid.retrievers
+    store = dense.vectorstore
+    with metrics.timer("dense"):
+        if hasattr(store, "similarity_search_batch"):
+            k = dense.search_kwargs.get("k", settings.TOP_K_VECTOR)
+            dense_lists = [[d for d, _ in hits] for hits in store.similarity_search_batch(queries, k)]
+        else:
+            dense_lists = dense.batch(queries)
+    with metrics.timer("bm25"):
+        bm25_lists = [bm25.invoke(q) for q in queries]
+    return [_fuse(hybrid, [d, b]) for d, b in zip(dense_lists, bm25_lists)]
+
+def rerank(query: str, docs, topn: int = 10, kinds: Optional[Iterable[str]] = None,
+           deadline: Optional[float] = None) -> List[RetrievedDoc]:
+    return rerank_many([query], [docs], topn=topn, kinds=kinds, deadline=deadline)[0]
+
+def rerank_many(queries: List[str], doc_lists: List[List[Document]], topn: int = 10,
+                kinds: Optional[Iterable[str]] = None, deadline: Optional[float] = None) -> List[List[RetrievedDoc]]:
+    """Rerank several candidate lists; all uncached pairs go through one predict() call.
+
+    Cascade: only the first RERANK_MAX_CANDIDATES docs of each (fused) list
+    reach the cross-encoder. With a deadline (time.perf_counter() value),
+    uncached pairs are limited to what the measured per-pair cost allows;
+    docs left over keep their fusion order after the reranked ones, with
+    meta["reranked"] = False.
+    """
+    with metrics.timer("rerank"):
+        return _rerank_many(queries, doc_lists, topn, kinds, deadline)
+
+def _rerank_many(queries: List[str], doc_lists: List[List[Document]], topn: int,
+                 kinds: Optional[Iterable[str]], deadline: Optional[float]) -> List[List[RetrievedDoc]]:
+    global _pair_cost
+    # Optionally drop kinds the caller will discard before paying for inference
+    kinds = set(kinds) if kinds is not None else set(settings.RERANK_KINDS)
+    if kinds:
+        doc_lists = [[d for d in docs if d.metadata.get("kind") in kinds] for docs in doc_lists]
+    cap = settings.RERANK_MAX_CANDIDATES
+    if cap:
+        doc_lists = [docs[:cap] for docs in doc_lists]
+    # Cross-encoder scores the pair (query, doc); only uncached pairs hit the model
+    keys = [[(q, doc_id(d.metadata)) for d in docs] for q, docs in zip(queries, doc_lists)]
+    scores = [[pair_scores.get(k) for k in row] for row in keys]
+    todo = [(i, j) for i, row in enumerate(scores) for j, s in enumerate(row) if s is None]
+    if todo and deadline is not None and _pair_cost > 0:
+        affordable = max(0, int((deadline - time.perf_counter()) / _pair_cost))
+        if affordable < len(todo):
+            metrics.incr("rerank_skipped" if affordable == 0 else "rerank_truncated")
+            todo = todo[:affordable]   # fusion order: the best candidates get scored first
+    if todo:
+        pairs = [(queries[i], doc_lists[i][j].page_content) for i, j in todo]
+        t0 = time.perf_counter()
+        fresh = get_cross_encoder().predict(pairs, batch_size=settings.RERANK_BATCH_SIZE)
+        cost = (time.perf_counter() - t0) / len(pairs)
+        _pair_cost = cost if _pair_cost == 0 else 0.8 * _pair_cost + 0.2 * cost
+        for (i, j), s in zip(todo, fresh):
+            scores[i][j] = float(s)
+            pair_scores.put(keys[i][j], scores[i][j])
+    results = []
+    for docs, row in zip(doc_lists, scores):
+        scored = sorted(((d, s) for d, s in zip(docs, row) if s is not None), key=lambda x: x[1], reverse=True)
+        unscored = [(d, None) for d, s in zip(docs, row) if s is None]
+        out: List[RetrievedDoc] = []
+        for doc, s in (scored + unscored)[:topn]:
+            meta = dict(doc.metadata)
+            if s is None:
+                meta["reranked"] = False
+            out.append(RetrievedDoc(
+                source_id=meta.get("source_id", ""),
+                text=doc.page_content,
+                meta=meta,
+                score=float(s) if s is not None else 0.0
+            ))
+        results.append(out)
+    return results
@@ -0,0 +1,227 @@
+# app/retrieval/local_index.py
+from typing import Any, Iterable, List, Optional, Sequence, Tuple
+import tempfile, uuid
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+
+def _normalize(mat: np.ndarray) -> np.ndarray:
+    mat = np.ascontiguousarray(mat, dtype=np.float32)
+    if mat.ndim == 1:
+        mat = mat[None, :]
+    norms = np.linalg.norm(mat, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return mat / norms
+
+
+def top_k(sims: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Row-wise top-k of a (queries, docs) score matrix, best first.
+
+    argpartition keeps selection O(n) per row; only the k survivors are sorted
+    (ties broken by lower row index so results are reproducible).
+    """
+    n = sims.shape[1]
+    k = min(k, n)
+    if k <= 0:
+        empty = np.empty((sims.shape[0], 0))
+        return empty.astype(np.int64), empty.astype(np.float32)
+    if k < n:
+        idx = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+    else:
+        idx = np.broadcast_to(np.arange(n), sims.shape).copy()
+    part = np.take_along_axis(sims, idx, axis=1)
+    order = np.lexsort((idx, -part), axis=1)
+    idx = np.take_along_axis(idx, order, axis=1)
+    return idx, np.take_along_axis(part, order, axis=1)
+
+
+QUANT_KINDS = ("int8", "float16")
+_BLOCK = 2048  # rows widened to float32 at a time; small enough to stay in cache
+
+
+def quantize_rows(mat: np.ndarray, kind: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """(codes, per-row scales) for L2-normalized rows; scales is None for float16.
+
+    int8 uses symmetric per-vector scaling: row ~= codes * scale.
+    """
+    if kind == "float16":
+        return np.asarray(mat, dtype=np.float16), None
+    if kind != "int8":
+        raise ValueError(f"unknown quantization {kind!r}; expected one of {QUANT_KINDS}")
+    codes = np.empty(mat.shape, dtype=np.int8)
+    scales = np.empty(len(mat), dtype=np.float32)
+    for s in range(0, len(mat), _BLOCK):
+        blk = np.asarray(mat[s:s + _BLOCK], dtype=np.float32)
+        sc = np.abs(blk).max(axis=1) / 127.0
+        sc[sc == 0] = 1.0
+        codes[s:s + _BLOCK] = np.rint(blk / sc[:, None])
+        scales[s:s + _BLOCK] = sc
+    return codes, scales
+
+
+def _spill(mat: np.ndarray) -> np.ndarray:
+    """Move a float32 matrix to an anonymous temp file and map it back read-only."""
+    f = tempfile.TemporaryFile(prefix="vectors-")
+    mm = np.memmap(f, dtype=np.float32, mode="w+", shape=mat.shape)
+    mm[:] = mat
+    mm.flush()
+    return np.memmap(f, dtype=np.float32, mode="r", shape=mat.shape)
+
+
+class NumpyVectorStore(VectorStore):
+    """In-process exact cosine index over a contiguous float32 matrix.
+
+    Drop-in for PineconeVectorStore in build_hybrid_retriever: the inherited
+    as_retriever(search_kwargs={"k": ...}) calls similarity_search below.
+
+    After quantize(), the first pass scans compact int8/float16 codes held in
+    RAM. The best k * rescore_factor candidates are then re-scored exactly
+    against float32 rows read from a memory-mapped file.
+    """
+
+    def __init__(self, embedding: Embeddings):
+        self._embedding = embedding
+        self._matrix = np.empty((0, 0), dtype=np.float32)
+        self._docs: List[Document] = []
+        self._ids: List[str] = []
+        self._quant: Optional[str] = None
+        self._codes: Optional[np.ndarray] = None
+        self._scales: Optional[np.ndarray] = None
+        self.rescore_factor = 4
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._embedding
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None,
+                  ids: Optional[List[str]] = None, **kwargs: Any) -> List[str]:
+        texts = list(texts)
+        if not texts:
+            return []
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [uuid.uuid4().hex for _ in texts]
+        vecs = _normalize(np.asarray(self._embedding.embed_documents(texts), dtype=np.float32))
+        if len(self._docs):
+            self._matrix = np.ascontiguousarray(np.vstack([self._matrix, vecs]))
+        else:
+            self._matrix = vecs
+        self._docs.extend(Document(page_content=t, metadata=dict(m)) for t, m in zip(texts, metadatas))
+        self._ids.extend(ids)
+        if self._quant:
+            self.quantize(self._quant, rescore_factor=self.rescore_factor)
+        return ids
+
+    def quantize(self, kind: str, codes: Optional[np.ndarray] = None, scales: Optional[np.ndarray] = None,
+                 rescore_factor: int = 4) -> "NumpyVectorStore":
+        """Switch to a quantized first pass (kind: int8 | float16).
+
+        Precomputed codes/scales (e.g. memory-mapped from build-index
+        artifacts) are used as-is. The float32 rows move out of RAM: a
+        memmap stays a memmap, an in-memory matrix is spilled to a temp file.
+        """
+        if codes is None:
+            codes, scales = quantize_rows(self._matrix, kind)
+        if not isinstance(self._matrix, np.memmap):
+            self._matrix = _spill(self._matrix)
+        self._quant, self._codes, self._scales = kind, codes, scales
+        self.rescore_factor = max(1, rescore_factor)
+        return self
+
+    def with_quantization(self, kind: Optional[str], rescore_factor: int = 4) -> "NumpyVectorStore":
+        """Copy sharing docs and float32 rows with another first pass (None = exact)."""
+        out = NumpyVectorStore.from_matrix(self._embedding, self._matrix, self._docs, self._ids)
+        return out.quantize(kind, rescore_factor=rescore_factor) if kind else out
+
+    def memory_bytes(self) -> int:
+        """RAM held by the scanned vectors (memory-mapped float32 rows excluded)."""
+        if self._quant:
+            return self._codes.nbytes + (self._scales.nbytes if self._scales is not None else 0)
+        return 0 if isinstance(self._matrix, np.memmap) else self._matrix.nbytes
+
+    def with_changes(self, texts: List[str], metadatas: List[dict], ids: List[str],
+                     delete_ids: Iterable[str] = ()) -> "NumpyVectorStore":
+        """Copy with `ids` upserted and `delete_ids` removed. Only the new texts
+        are embedded; surviving rows are copied, never re-embedded. The current
+        store is untouched, so in-flight searches stay consistent."""
+        drop = set(delete_ids) | set(ids)
+        keep = [i for i, _id in enumerate(self._ids) if _id not in drop]
+        out = NumpyVectorStore(self._embedding)
+        if keep:
+            out._matrix = np.ascontiguousarray(self._matrix[keep])
+            out._docs = [self._docs[i] for i in keep]
+            out._ids = [self._ids[i] for i in keep]
+        out.add_texts(texts, metadatas=metadatas, ids=ids)
+        if self._quant:
+            out.quantize(self._quant, rescore_factor=self.rescore_factor)
+        return out
+
+    def search_vectors(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Batched exact search: one (m, d) x (d, n) product for m queries."""
+        if not len(self._docs):
+            empty = np.empty((len(queries), 0))
+            return empty.astype(np.int64), empty.astype(np.float32)
+        q = _normalize(queries)
+        if self._quant:
+            return self._search_quantized(q, k)
+        return top_k(q @ self._matrix.T, k)
+
+    def _search_quantized(self, q: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        n = len(self._codes)
+        approx = np.empty((len(q), n), dtype=np.float32)
+        for s in range(0, n, _BLOCK):
+            approx[:, s:s + _BLOCK] = q @ np.asarray(self._codes[s:s + _BLOCK], dtype=np.float32).T
+        if self._scales is not None:
+            approx *= self._scales
+        cand, _ = top_k(approx, k * self.rescore_factor)
+        idx_rows, score_rows = [], []
+        for qi, row in zip(q, cand):
+            row = np.sort(row)                      # sequential reads from the mapped file
+            exact = np.asarray(self._matrix[row], dtype=np.float32) @ qi
+            i, sc = top_k(exact[None, :], k)
+            idx_rows.append(row[i[0]])
+            score_rows.append(sc[0])
+        return np.stack(idx_rows), np.stack(score_rows)
+
+    def similarity_search_batch(self, queries: Sequence[str], k: int = 4) -> List[List[Tuple[Document, float]]]:
+        if not queries:
+            return []
+        qv = np.asarray(self._embedding.embed_documents(list(queries)), dtype=np.float32)
+        idx, scores = self.search_vectors(qv, k)
+        return [[(self._docs[i], float(s)) for i, s in zip(row_i, row_s)]
+                for row_i, row_s in zip(idx, scores)]
+
+    def similarity_search_by_vector_with_score(self, embedding: List[float], k: int = 4) -> List[Tuple[Document, float]]:
+        idx, scores = self.search_vectors(np.asarray(embedding, dtype=np.float32), k)
+        return [(self._docs[i], float(s)) for i, s in zip(idx[0], scores[0])]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.similarity_search_by_vector_with_score(self._embedding.embed_query(query), k)
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Document]:
+        return [d for d, _ in self.similarity_search_by_vector_with_score(embedding, k)]
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [d for d, _ in self.similarity_search_with_score(query, k)]
+
+    def _select_relevance_score_fn(self):
+        return self._cosine_relevance_score_fn
+
+    @classmethod
+    def from_matrix(cls, embedding: Embeddings, matrix: np.ndarray, docs: List[Document],
+                    ids: List[str]) -> "NumpyVectorStore":
+        """Wrap precomputed, L2-normalized vectors (e.g. a read-only memmap) without copying."""
+        store = cls(embedding)
+        store._matrix, store._docs, store._ids = matrix, list(docs), list(ids)
+        return store
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[dict]] = None,
+                   ids: Optional[List[str]] = None, **kwargs: Any) -> "NumpyVectorStore":
+        store = cls(embedding)
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        return store
@@ -1,14 +1,50 @@
 # app/retrieval/vector.py
-from typing import List, Dict
-from langchain_pinecone import PineconeVectorStore
-from langchain_community.embeddings import HuggingFaceEmbeddings 
-from pinecone import Pinecone, ServerlessSpec
+import zlib
+from typing import Iterable, List, Dict
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
 from app.config import settings
+from app.retrieval.local_index import NumpyVectorStore
+from app.services.inference import PooledEmbeddings, get_pool
+
+class HashingEmbeddings(Embeddings):
+    """Signed feature-hashing embeddings: deterministic, model-free stand-in for
+    offline runs and benchmarks (EMBEDDING_BACKEND=hash)."""
+
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+
+    def _embed(self, text: str) -> np.ndarray:
+        v = np.zeros(self.dim, dtype=np.float32)
+        for tok in text.lower().split():
+            h = zlib.crc32(tok.encode())
+            v[h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        n = np.linalg.norm(v)
+        return v / n if n else v
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return np.stack([self._embed(t) for t in texts]).tolist() if texts else []
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text).tolist()
 
 def get_embeddings():
+    pool = get_pool()
+    if pool is not None:
+        return PooledEmbeddings(pool)  # computed by the warm worker processes
+    if settings.EMBEDDING_BACKEND == "hash":
+        return HashingEmbeddings(settings.EMBEDDING_DIM)
+    # pulls in torch/sentence-transformers; only imported when actually used
+    from langchain_community.embeddings import HuggingFaceEmbeddings
     return HuggingFaceEmbeddings(model_name=settings.EMBEDDING_MODEL)
 
+def doc_id(meta: Dict) -> str:
+    return f"{meta.get('kind', 'doc')}:{meta.get('source_id', '')}"
+
 def ensure_pinecone_index(dim: int = 384):
+    from pinecone import Pinecone, ServerlessSpec
     pc = Pinecone(api_key=settings.PINECONE_API_KEY)
     existing = [i.name for i in pc.list_indexes()]
     if settings.PINECONE_INDEX not in existing:
@@ -20,14 +56,68 @@ def ensure_pinecone_index(dim: int = 384):
         )
     return pc
 
-def build_vectorstore(docs: List[Dict]) -> PineconeVectorStore:
-    ensure_pinecone_index()
+def embedding_signature() -> str:
+    """Identifies the embedding space; artifacts built with another one are not reused."""
+    if settings.EMBEDDING_BACKEND == "hash":
+        return f"hash:{settings.EMBEDDING_DIM}"
+    return f"hf:{settings.EMBEDDING_MODEL}"
+
+def build_vectorstore(docs: List[Dict], artifacts=None) -> VectorStore:
+    """Dense index over docs. With prebuilt artifacts (app.retrieval.artifacts)
+    nothing is re-embedded: the local index maps embeddings.npy read-only, and
+    Pinecone is only upserted once per artifact version."""
     emb = get_embeddings()
     texts = [d["text"] for d in docs]
     metadatas = [d["meta"] for d in docs]
-    return PineconeVectorStore.from_texts(
+    if settings.VECTOR_BACKEND == "local":
+        if artifacts is not None:
+            lc_docs = [Document(page_content=t, metadata=m) for t, m in zip(texts, metadatas)]
+            store = NumpyVectorStore.from_matrix(emb, artifacts.matrix, lc_docs, artifacts.ids)
+        else:
+            # exact in-process cosine search; no network hop, works air-gapped
+            store = NumpyVectorStore.from_texts(
+                texts=texts,
+                embedding=emb,
+                metadatas=metadatas,
+                ids=[doc_id(m) for m in metadatas],
+            )
+        kind = settings.DENSE_QUANTIZATION
+        if kind != "none":
+            pre = artifacts.quantized(kind) if artifacts is not None else None
+            codes, scales = pre if pre is not None else (None, None)
+            store.quantize(kind, codes=codes, scales=scales, rescore_factor=settings.DENSE_RESCORE_FACTOR)
+        return store
+    from langchain_pinecone import PineconeVectorStore
+    target = f"pinecone-{settings.PINECONE_INDEX}"
+    if artifacts is not None and artifacts.synced_to(target):
+        # this exact corpus is already in the index; just connect
+        return PineconeVectorStore(index_name=settings.PINECONE_INDEX, embedding=emb)
+    ensure_pinecone_index()
+    store = PineconeVectorStore.from_texts(
         texts=texts,
         embedding=emb,             # <-- corrected
         index_name=settings.PINECONE_INDEX,
-        metadatas=metadatas
+        metadatas=metadatas,
+        ids=[doc_id(m) for m in metadatas],  # stable ids: restarts overwrite, updates/deletes can target them
     )
+    if artifacts is not None:
+        artifacts.mark_synced(target)
+    return store
+
+def apply_vector_changes(store: VectorStore, upserts: List[Dict], deletes: Iterable[str] = ()) -> VectorStore:
+    """Upsert/delete docs by doc_id, embedding only the changed ones.
+
+    The local index is copy-on-write and a new store is returned; Pinecone is
+    updated in place (same object returned).
+    """
+    texts = [d["text"] for d in upserts]
+    metadatas = [d["meta"] for d in upserts]
+    ids = [doc_id(m) for m in metadatas]
+    deletes = list(deletes)
+    if isinstance(store, NumpyVectorStore):
+        return store.with_changes(texts, metadatas, ids, delete_ids=deletes)
+    if texts:
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+    if deletes:
+        store.delete(ids=deletes)
+    return store
@@ -42,3 +42,10 @@ class AdviseResponse(BaseModel):
     timeline: Timeline
     notes: str
     metrics: Dict[str, float]
+    plan_id: Optional[str] = None   # fetch the PDF later via GET /plan/{plan_id}/pdf
+
+class CatalogChanges(BaseModel):
+    upsert_courses: List[Course] = Field(default_factory=list)
+    delete_courses: List[str] = Field(default_factory=list)   # course_ids
+    upsert_jds: List[JD] = Field(default_factory=list)
+    delete_jds: List[str] = Field(default_factory=list)       # roles
@@ -0,0 +1,99 @@
+# app/services/cache.py
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List
+
+_MISSING = object()
+
+class LRUCache:
+    """Bounded, thread-safe LRU map with hit/miss counters."""
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = max(0, int(maxsize))
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            value = self._data.get(key, _MISSING)
+            if value is _MISSING:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        if not self.maxsize:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._data
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def values(self) -> List[Any]:
+        """Snapshot of the values, least recently used first (does not touch recency)."""
+        with self._lock:
+            return list(self._data.values())
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"size": len(self._data), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
+
+
+class BytesLRUCache(LRUCache):
+    """LRU of bytes values bounded by total payload size rather than entry count."""
+
+    def __init__(self, max_bytes: int):
+        super().__init__(maxsize=1 << 62)
+        self.max_bytes = max(0, int(max_bytes))
+        self.nbytes = 0
+
+    def put(self, key: Hashable, value: bytes) -> None:
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.nbytes -= len(old)
+            self._data[key] = value
+            self.nbytes += len(value)
+            while self.nbytes > self.max_bytes:
+                _, evicted = self._data.popitem(last=False)
+                self.nbytes -= len(evicted)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            value = self._data.pop(key, _MISSING)
+            if value is _MISSING:
+                return default
+            self.nbytes -= len(value)
+            return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.nbytes = 0
+
+    def stats(self) -> Dict:
+        out = super().stats()
+        out.update(maxsize=None, bytes=self.nbytes, max_bytes=self.max_bytes)
+        return out
@@ -0,0 +1,134 @@
+# app/services/explain_cache.py
+import hashlib, json, os, sqlite3, threading, time
+from typing import Dict, List, Optional, Tuple
+import structlog
+from app.config import settings
+from app.schemas import Course
+from app.services.cache import LRUCache
+
+log = structlog.get_logger()
+
+def explanation_key(course_id: str, goal_role: str, gap_map: Dict[str, int]) -> str:
+    # explanations only depend on the course, the role and *which* skills are missing
+    raw = json.dumps([course_id, goal_role, sorted(gap_map)], separators=(",", ":"))
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+def course_fingerprint(course: Course) -> str:
+    return hashlib.sha1(course.model_dump_json().encode()).hexdigest()
+
+class ExplanationCache:
+    """Two-tier cache of LLM "why" text: in-memory LRU in front of SQLite.
+
+    Entries carry the fingerprint of the course they were generated for, so an
+    edited course record never serves a stale explanation; both tiers expire
+    entries after ttl_sec.
+    """
+
+    def __init__(self, path: str = "", ttl_sec: float = 7 * 86400, memory_size: int = 4096):
+        self.ttl_sec = ttl_sec
+        self.memory = LRUCache(memory_size)
+        self._db: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        if path:
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+                self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS explanations ("
+                    " key TEXT PRIMARY KEY, course_id TEXT, fingerprint TEXT, text TEXT, created REAL)"
+                )
+                self._db.execute("CREATE INDEX IF NOT EXISTS ix_expl_course ON explanations(course_id)")
+            except sqlite3.Error as e:
+                log.warning("explain_cache_disk_disabled", path=path, error=str(e))
+                self._db = None
+
+    def _fresh(self, created: float) -> bool:
+        return not self.ttl_sec or time.time() - created < self.ttl_sec
+
+    @property
+    def has_disk(self) -> bool:
+        return self._db is not None
+
+    def get(self, course: Course, goal_role: str, gap_map: Dict[str, int]) -> Optional[str]:
+        return self.get_many([(course, goal_role, gap_map)])[0]
+
+    def get_memory(self, course: Course, goal_role: str, gap_map: Dict[str, int]) -> Optional[str]:
+        """Memory tier only: never touches SQLite, safe on the event loop."""
+        hit: Optional[Tuple[str, str, float]] = self.memory.get(explanation_key(course.course_id, goal_role, gap_map))
+        if hit and hit[0] == course_fingerprint(course) and self._fresh(hit[2]):
+            return hit[1]
+        return None
+
+    def get_many(self, items: List[Tuple[Course, str, Dict[str, int]]]) -> List[Optional[str]]:
+        """get() for several entries; memory misses share one SQLite query per 500 keys."""
+        out: List[Optional[str]] = []
+        miss: Dict[str, List[Tuple[int, str]]] = {}    # key -> [(position, fingerprint)]
+        for i, (course, goal_role, gap_map) in enumerate(items):
+            key = explanation_key(course.course_id, goal_role, gap_map)
+            fp = course_fingerprint(course)
+            hit: Optional[Tuple[str, str, float]] = self.memory.get(key)
+            if hit and hit[0] == fp and self._fresh(hit[2]):
+                out.append(hit[1])
+            else:
+                out.append(None)
+                miss.setdefault(key, []).append((i, fp))
+        if not miss or self._db is None:
+            return out
+        keys = list(miss)
+        rows = []
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                part = keys[start:start + 500]
+                rows += self._db.execute(
+                    "SELECT key, fingerprint, text, created FROM explanations WHERE key IN (%s)"
+                    % ",".join("?" * len(part)), part,
+                ).fetchall()
+        for key, fp, text, created in rows:
+            if not self._fresh(created):
+                continue
+            hits = [i for i, want in miss[key] if want == fp]
+            if hits:
+                self.memory.put(key, (fp, text, created))
+            for i in hits:
+                out[i] = text
+        return out
+
+    def put(self, course: Course, goal_role: str, gap_map: Dict[str, int], text: str) -> None:
+        key = explanation_key(course.course_id, goal_role, gap_map)
+        entry = (course_fingerprint(course), text, time.time())
+        self.memory.put(key, entry)
+        if self._db is None:
+            return
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO explanations (key, course_id, fingerprint, text, created) VALUES (?, ?, ?, ?, ?)",
+                (key, course.course_id, *entry),
+            )
+
+    def invalidate_course(self, course_id: str) -> None:
+        # memory entries are keyed by hash; stale ones are rejected by fingerprint on read
+        if self._db is None:
+            return
+        with self._lock:
+            self._db.execute("DELETE FROM explanations WHERE course_id = ?", (course_id,))
+
+    def purge_expired(self) -> int:
+        if self._db is None or not self.ttl_sec:
+            return 0
+        with self._lock:
+            cur = self._db.execute("DELETE FROM explanations WHERE created < ?", (time.time() - self.ttl_sec,))
+        return cur.rowcount
+
+    def stats(self) -> Dict:
+        out = {"memory": self.memory.stats()}
+        if self._db is not None:
+            with self._lock:
+                out["disk_entries"] = self._db.execute("SELECT COUNT(*) FROM explanations").fetchone()[0]
+        return out
+
+explanations = ExplanationCache(
+    path=settings.EXPLAIN_CACHE_PATH,
+    ttl_sec=settings.EXPLAIN_CACHE_TTL_SEC,
+    memory_size=settings.EXPLAIN_CACHE_SIZE,
+)
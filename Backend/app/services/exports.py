@@ -0,0 +1,342 @@
+#app/services/exports.py
+"""Background cohort exports: plan PDFs for a whole file of profiles.
+
+A cohort is NDJSON, one AdviseRequest per line plus an optional "name"
+printed on that profile's PDF. A job reads it from disk in chunks of
+BATCH_CHUNK_SIZE, plans each chunk with the batched /advise path (so the
+plan cache is shared with the API), and renders the PDFs on a pool of
+worker processes. At most EXPORT_WINDOW renders are in flight and each
+finished PDF goes straight into the ZIP on disk, in input order, so memory
+does not grow with the cohort. Jobs live in this process; their files stay
+in EXPORT_DIR until deleted or pushed out by EXPORT_KEEP_JOBS newer jobs.
+"""
+import itertools, json, multiprocessing, os, re, secrets, shutil, threading, time, uuid, zipfile
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Callable, Deque, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+import structlog
+from pydantic import ValidationError
+from app.schemas import AdviseRequest, AdviseResponse
+from app.services.cache import BytesLRUCache, LRUCache
+from app.services.metrics import metrics
+from app.services.pdf import plan_digest, render_plan_pdf_bytes, render_plans_pdf
+
+log = structlog.get_logger()
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+FORMATS = ("zip", "pdf")
+_MAX_ERRORS = 20        # errors listed in the job status; all of them go to errors.ndjson
+_DEDUPE = 256           # recent PDFs a job reuses for identical plans (same gaps, no name)
+
+
+def _render_pages_file(src: str, dst: str) -> int:
+    """Worker side of format=pdf: one page per line of render kwargs, one document."""
+    n = 0
+
+    def pages():
+        nonlocal n
+        with open(src, encoding="utf-8") as f:
+            for line in f:
+                n += 1
+                yield json.loads(line)
+
+    render_plans_pdf(dst, pages())
+    return n
+
+
+def _slug(name: str) -> str:
+    return re.sub(r"[^A-Za-z0-9._-]+", "_", name).strip("._")[:60] or "candidate"
+
+
+class ExportJob:
+    """State of one export; counters are only written by the job's thread."""
+
+    def __init__(self, job_id: str, fmt: str, path: str):
+        self.id = job_id
+        self.token = secrets.token_urlsafe(24)   # handed to the submitter only
+        self.format = fmt
+        self.dir = path
+        self.source = os.path.join(path, "cohort.ndjson")
+        self.result = os.path.join(path, f"export.{fmt}")
+        self.status = QUEUED
+        self.total = self.planned = self.rendered = self.failed = 0
+        self.errors: List[Dict] = []
+        self.error: Optional[str] = None
+        self.created = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.cancelled = threading.Event()
+        self.launched = False   # set by start(); until then no thread owns the files
+
+    def owned_by(self, token: str) -> bool:
+        return bool(token) and secrets.compare_digest(token.encode(), self.token.encode())
+
+    @property
+    def active(self) -> bool:
+        return self.status in (QUEUED, RUNNING)
+
+    def to_dict(self) -> Dict:
+        out = {
+            "job_id": self.id,
+            "status": self.status,
+            "format": self.format,
+            "total": self.total,
+            "planned": self.planned,
+            "rendered": self.rendered,
+            "failed": self.failed,
+            "progress": round((self.rendered + self.failed) / self.total, 4) if self.total else 0.0,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "errors": list(self.errors),
+        }
+        if self.error:
+            out["error"] = self.error
+        if self.status == DONE:
+            out["download"] = f"/exports/{self.id}/download"
+        return out
+
+
+class ExportManager:
+    """Runs export jobs on background threads and PDF renders on worker processes.
+
+    `advise_batch(reqs)` yields an AdviseResponse or an {"error", "status"}
+    dict per request, in order; `pdf_args(goal_role, plan)` gives the
+    render_plan_pdf kwargs. Both come from the app, as does `pdf_cache`,
+    which is read (never filled) so plans already rendered by /plan/pdf are
+    not rendered again. With workers=0 PDFs render on the job's thread.
+    """
+
+    def __init__(self, root: str, advise_batch: Callable[[List[AdviseRequest]], Iterable],
+                 pdf_args: Callable[[str, AdviseResponse], Dict], pdf_cache: Optional[BytesLRUCache],
+                 workers: int, max_jobs: int, window: int, chunk_size: int, keep: int, merged_max: int):
+        self.root = root
+        self.advise_batch = advise_batch
+        self.pdf_args = pdf_args
+        self.pdf_cache = pdf_cache
+        self.workers = workers
+        self.window = max(1, window)
+        self.chunk_size = max(1, chunk_size)
+        self.keep = max(1, keep)
+        self.merged_max = merged_max
+        self._jobs: "OrderedDict[str, ExportJob]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max(1, max_jobs))
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    # --- API side ---
+
+    def create(self, fmt: str) -> ExportJob:
+        """A queued job with an empty directory; write its cohort to job.source, then start()."""
+        job_id = uuid.uuid4().hex
+        job = ExportJob(job_id, fmt, os.path.join(self.root, job_id))
+        os.makedirs(job.dir)
+        with self._lock:
+            self._jobs[job_id] = job
+        self._prune()
+        return job
+
+    def start(self, job: ExportJob) -> None:
+        metrics.incr("export_jobs")
+        job.launched = True
+        threading.Thread(target=self._run, args=(job,), daemon=True, name=f"export-{job.id[:8]}").start()
+
+    def get(self, job_id: str) -> Optional[ExportJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def jobs(self) -> List[ExportJob]:
+        with self._lock:
+            return list(self._jobs.values())
+
+    def delete(self, job_id: str) -> Optional[ExportJob]:
+        """Forget a job and remove its files. A started job that is queued or
+        running is cancelled instead, and its thread removes the files when it
+        stops; a job never started (its upload failed) has no thread, so its
+        files go now."""
+        with self._lock:
+            job = self._jobs.pop(job_id, None)
+        if job is not None:
+            job.cancelled.set()
+            if not (job.launched and job.active):
+                shutil.rmtree(job.dir, ignore_errors=True)
+        return job
+
+    def close(self) -> None:
+        for job in self.jobs():
+            job.cancelled.set()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _prune(self) -> None:
+        with self._lock:
+            finished = [j for j in self._jobs.values() if not j.active]
+        for job in finished[:max(0, len(finished) - self.keep)]:
+            self.delete(job.id)
+
+    # --- job thread ---
+
+    def _run(self, job: ExportJob) -> None:
+        with self._slots:
+            if job.cancelled.is_set():
+                self._stop(job, CANCELLED)
+                return
+            job.status, job.started = RUNNING, time.time()
+            t0 = time.perf_counter()
+            try:
+                job.total = self._count(job.source)
+                if job.format == "pdf" and self.merged_max and job.total > self.merged_max:
+                    raise ValueError(f"format=pdf is limited to {self.merged_max} profiles; use format=zip")
+                if job.format == "zip":
+                    self._write_zip(job)
+                else:
+                    self._write_merged(job)
+            except Exception as e:
+                log.error("export_failed", job=job.id, err=str(e))
+                job.error = str(e)
+                self._stop(job, FAILED)
+                return
+            self._stop(job, CANCELLED if job.cancelled.is_set() else DONE)
+            log.info("export_done", job=job.id, status=job.status, total=job.total, rendered=job.rendered,
+                     failed=job.failed, sec=round(time.perf_counter() - t0, 3))
+
+    def _stop(self, job: ExportJob, status: str) -> None:
+        job.finished = time.time()
+        job.status = status
+        if status == CANCELLED:
+            shutil.rmtree(job.dir, ignore_errors=True)
+        elif os.path.exists(job.source):
+            os.remove(job.source)   # the cohort is not needed once the job has ended
+
+    @staticmethod
+    def _count(path: str) -> int:
+        with open(path, "rb") as f:
+            return sum(1 for line in f if line.strip())
+
+    def _items(self, job: ExportJob) -> Iterator[Tuple[int, str, AdviseRequest, Union[AdviseResponse, Dict]]]:
+        """(line number, name, request, plan or error) per profile, in order, planned a chunk at a time."""
+        with open(job.source, "rb") as f:
+            lines = ((n, line) for n, line in enumerate(f, 1) if line.strip())
+            while not job.cancelled.is_set():
+                chunk = list(itertools.islice(lines, self.chunk_size))
+                if not chunk:
+                    return
+                parsed: List[Tuple[int, str, Union[AdviseRequest, Dict]]] = []
+                for n, line in chunk:
+                    try:
+                        obj = json.loads(line)
+                        req = AdviseRequest.model_validate(obj)
+                        parsed.append((n, str(obj.get("name") or ""), req))
+                    except (ValueError, ValidationError) as e:
+                        parsed.append((n, "", {"error": str(e).splitlines()[0], "status": 422}))
+                results = iter(self.advise_batch([r for _, _, r in parsed if isinstance(r, AdviseRequest)]))
+                for n, name, req in parsed:
+                    job.planned += 1
+                    yield (n, name, None, req) if isinstance(req, dict) else (n, name, req, next(results))
+
+    def _fail(self, job: ExportJob, errors, line: int, name: str, err: Dict) -> None:
+        job.failed += 1
+        metrics.incr("export_profiles_failed")
+        entry = {"line": line, "name": name, **err}
+        errors.write(json.dumps(entry) + "\n")
+        if len(job.errors) < _MAX_ERRORS:
+            job.errors.append(entry)
+
+    def _args(self, name: str, req: AdviseRequest, plan: AdviseResponse) -> Tuple[str, Dict]:
+        """Cache key and render kwargs; unnamed PDFs share /plan/pdf's plan_id key."""
+        args = self.pdf_args(req.profile.goal_role, plan)
+        if name:
+            args["name"] = name
+        key = plan.plan_id if plan.plan_id and not name else plan_digest(**args)[:24]
+        return key, args
+
+    def _render(self, seen: LRUCache, name: str, req: AdviseRequest, plan: AdviseResponse) -> Future:
+        key, args = self._args(name, req, plan)
+        fut = seen.get(key)
+        if fut is None:
+            pdf = self.pdf_cache.get(key) if self.pdf_cache is not None else None
+            if pdf is None:
+                fut = self._submit(render_plan_pdf_bytes, **args)
+            else:
+                fut = Future()
+                fut.set_result(pdf)
+            seen.put(key, fut)
+        else:
+            metrics.incr("export_pdfs_reused")
+        return fut
+
+    def _write_zip(self, job: ExportJob) -> None:
+        tmp = job.result + ".part"
+        seen = LRUCache(_DEDUPE)
+        window: Deque[Tuple[int, str, Future]] = deque()
+        errors_path = os.path.join(job.dir, "errors.ndjson")
+        with zipfile.ZipFile(tmp, "w", zipfile.ZIP_DEFLATED) as zf, \
+                open(errors_path, "w", encoding="utf-8") as errors:
+
+            def store(line: int, name: str, fut: Future) -> None:
+                try:
+                    pdf = fut.result()
+                except Exception as e:
+                    self._fail(job, errors, line, name, {"error": f"render failed: {e}", "status": 500})
+                    return
+                zf.writestr(f"{line:06d}_{_slug(name)}.pdf", pdf)
+                job.rendered += 1
+                metrics.incr("export_pdfs")
+
+            for line, name, req, res in self._items(job):
+                if isinstance(res, dict):
+                    self._fail(job, errors, line, name, res)
+                    continue
+                window.append((line, name, self._render(seen, name, req, res)))
+                while len(window) >= self.window:
+                    store(*window.popleft())
+            while window and not job.cancelled.is_set():
+                store(*window.popleft())
+            for _, _, fut in window:
+                fut.cancel()
+            errors.flush()
+            if job.failed:
+                zf.write(errors_path, "errors.ndjson")
+        os.remove(errors_path)
+        if job.cancelled.is_set():
+            return
+        os.replace(tmp, job.result)
+
+    def _write_merged(self, job: ExportJob) -> None:
+        # plans are spooled to disk as render kwargs, then one worker draws every page
+        # into a single document (page ranges cannot be merged without a PDF library)
+        pages_path = os.path.join(job.dir, "pages.ndjson")
+        with open(pages_path, "w", encoding="utf-8") as pages, \
+                open(os.path.join(job.dir, "errors.ndjson"), "w", encoding="utf-8") as errors:
+            for line, name, req, res in self._items(job):
+                if isinstance(res, dict):
+                    self._fail(job, errors, line, name, res)
+                    continue
+                pages.write(json.dumps(self._args(name, req, res)[1]) + "\n")
+        if job.cancelled.is_set():
+            return
+        if job.failed == job.total:
+            raise ValueError("no profile could be planned")
+        tmp = job.result + ".part"
+        job.rendered = self._submit(_render_pages_file, pages_path, tmp).result()
+        metrics.incr("export_pdfs", job.rendered)
+        os.remove(pages_path)
+        os.replace(tmp, job.result)
+
+    def _submit(self, fn: Callable, *args, **kwargs) -> Future:
+        if self.workers <= 0:
+            fut: Future = Future()
+            try:
+                fut.set_result(fn(*args, **kwargs))
+            except Exception as e:
+                fut.set_exception(e)
+            return fut
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    # spawn, not fork: the parent has threads (and possibly torch) running
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                         mp_context=multiprocessing.get_context("spawn"))
+                    log.info("export_pool_started", workers=self.workers)
+        return self._executor.submit(fn, *args, **kwargs)
@@ -0,0 +1,239 @@
+#app/services/inference.py
+"""Model inference in a pool of warm worker processes (INFERENCE_WORKERS > 0).
+
+Query/doc embeddings and cross-encoder scoring leave the request threads:
+callers submit their texts or pairs to a MicroBatcher, which gathers what
+concurrent requests submit within INFERENCE_MAX_WAIT_MS (up to
+INFERENCE_MAX_BATCH items) into one call on a worker process, then routes
+each caller's slice of the result back through its Future. Workers load
+the models once, at start, so the GIL and cores are not shared with the
+request path.
+"""
+import multiprocessing, os, queue, threading, time
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import numpy as np
+import structlog
+from langchain_core.embeddings import Embeddings
+from app.config import settings
+from app.services.metrics import metrics
+
+log = structlog.get_logger()
+
+# --- worker process side ---
+
+_models: Dict[str, Any] = {}
+
+
+def _init_worker() -> None:
+    # inside a worker the models must be the local ones, not pool proxies
+    settings.INFERENCE_WORKERS = 0
+    from app.retrieval.hybrid import get_cross_encoder
+    from app.retrieval.vector import get_embeddings
+    _models["embed"] = get_embeddings()
+    _models["rerank"] = get_cross_encoder()
+
+
+def _ping(hold: float = 0.0) -> int:
+    # holding the worker briefly lets the other pings of a round reach other workers
+    time.sleep(hold)
+    return os.getpid()
+
+
+def _embed(texts: List[str]) -> np.ndarray:
+    return np.asarray(_models["embed"].embed_documents(texts), dtype=np.float32)
+
+
+def _predict(pairs: List[Tuple[str, str]], batch_size: int) -> np.ndarray:
+    return np.asarray(_models["rerank"].predict(pairs, batch_size=batch_size), dtype=np.float32)
+
+
+# --- app side ---
+
+class MicroBatcher:
+    """Merges concurrent submit() calls into batches for `run`.
+
+    `run(items)` must return a Future of one result per item. A dispatcher
+    thread takes the first waiting request, then keeps collecting until
+    max_batch items or max_wait_ms; it only forms a batch when one of
+    max_in_flight slots is free, so batches grow by themselves when the
+    workers are saturated. A submission that would push the batch past
+    max_batch starts the next one instead (one bigger than max_batch on its
+    own still goes alone). Results are sliced back to each caller's Future.
+    """
+
+    def __init__(self, name: str, run: Callable[[List], Future], max_batch: int,
+                 max_wait_ms: float, max_in_flight: int):
+        self.name = name
+        self._run = run
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max(0.0, max_wait_ms / 1000)
+        self._q: "queue.SimpleQueue[Optional[Tuple[List, Future]]]" = queue.SimpleQueue()
+        self._slots = threading.BoundedSemaphore(max(1, max_in_flight))
+        self._thread = threading.Thread(target=self._loop, daemon=True, name=f"batcher-{name}")
+        self._thread.start()
+
+    def submit(self, items: List) -> Future:
+        f: Future = Future()
+        if not items:
+            f.set_result([])
+        else:
+            self._q.put((list(items), f))
+        return f
+
+    def close(self) -> None:
+        self._q.put(None)
+        self._thread.join(timeout=5)
+
+    def _loop(self) -> None:
+        carry = None
+        while True:
+            first = carry if carry is not None else self._q.get()
+            carry = None
+            if first is None:
+                return
+            self._slots.acquire()
+            batch, n = [first], len(first[0])
+            end = time.perf_counter() + self.max_wait
+            closing = False
+            while n < self.max_batch:
+                try:
+                    nxt = self._q.get(timeout=max(0.0, end - time.perf_counter()))
+                except queue.Empty:
+                    break
+                if nxt is None:
+                    closing = True
+                    break
+                if n + len(nxt[0]) > self.max_batch:
+                    carry = nxt     # first of the next batch
+                    break
+                batch.append(nxt)
+                n += len(nxt[0])
+            self._dispatch(batch)
+            if closing:
+                return
+
+    def _dispatch(self, batch: List[Tuple[List, Future]]) -> None:
+        batch = [(items, f) for items, f in batch if f.set_running_or_notify_cancel()]
+        if not batch:
+            self._slots.release()
+            return
+        items = [x for its, _ in batch for x in its]
+        metrics.incr(f"inference_{self.name}_batches")
+        metrics.incr(f"inference_{self.name}_items", len(items))
+        try:
+            pending = self._run(items)
+        except Exception as e:
+            self._slots.release()
+            for _, f in batch:
+                f.set_exception(e)
+            return
+
+        def done(p: Future) -> None:
+            self._slots.release()
+            try:
+                out = p.result()
+            except BaseException as e:
+                log.error("inference_batch_failed", batcher=self.name, items=len(items), err=str(e))
+                for _, f in batch:
+                    f.set_exception(e)
+                return
+            i = 0
+            for its, f in batch:
+                f.set_result(out[i:i + len(its)])
+                i += len(its)
+
+        pending.add_done_callback(done)
+
+
+class InferencePool:
+    """Worker processes plus one micro-batcher per model."""
+
+    def __init__(self, workers: int, max_batch: int, max_wait_ms: float):
+        self.workers = workers
+        # spawn, not fork: the parent has threads (and possibly torch) running
+        self.executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                            initializer=_init_worker)
+        self.embed = MicroBatcher("embed", lambda texts: self.executor.submit(_embed, texts),
+                                  max_batch, max_wait_ms, workers)
+        self.rerank = MicroBatcher("rerank",
+                                   lambda pairs: self.executor.submit(_predict, pairs, settings.RERANK_BATCH_SIZE),
+                                   max_batch, max_wait_ms, workers)
+
+    def warm(self, timeout: Optional[float] = None) -> List[int]:
+        """Start every worker and wait until each has loaded its models.
+
+        A ping may land on any worker, so rounds of pings go out until every
+        worker process has answered one; pids of the workers are returned.
+        """
+        end = None if timeout is None else time.monotonic() + timeout
+        pids = set()
+        while len(pids) < self.workers:
+            left = None if end is None else end - time.monotonic()
+            if left is not None and left <= 0:
+                raise TimeoutError(f"{len(pids)} of {self.workers} inference workers answered")
+            futures = [self.executor.submit(_ping, 0.05) for _ in range(self.workers)]
+            pids.update(f.result(left) for f in futures)
+        return sorted(pids)
+
+    def close(self) -> None:
+        self.embed.close()
+        self.rerank.close()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+_pool: Optional[InferencePool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> Optional[InferencePool]:
+    """The process-wide pool, created on first use; None when INFERENCE_WORKERS=0."""
+    global _pool
+    if settings.INFERENCE_WORKERS <= 0:
+        return None
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = InferencePool(settings.INFERENCE_WORKERS, settings.INFERENCE_MAX_BATCH,
+                                      settings.INFERENCE_MAX_WAIT_MS)
+                log.info("inference_pool_started", workers=settings.INFERENCE_WORKERS,
+                         max_batch=settings.INFERENCE_MAX_BATCH, max_wait_ms=settings.INFERENCE_MAX_WAIT_MS)
+    return _pool
+
+
+def close_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+
+def _chunks(items: List, size: int) -> List[List]:
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+class PooledEmbeddings(Embeddings):
+    """Embeddings computed by the inference pool; big inputs are split so
+    several workers share them."""
+
+    def __init__(self, pool: InferencePool):
+        self.pool = pool
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        futures = [self.pool.embed.submit(c) for c in _chunks(list(texts), self.pool.embed.max_batch)]
+        return [row.tolist() for f in futures for row in f.result()]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.pool.embed.submit([text]).result()[0].tolist()
+
+
+class PooledCrossEncoder:
+    """CrossEncoder.predict() on the inference pool (batch_size is the workers' RERANK_BATCH_SIZE)."""
+
+    def __init__(self, pool: InferencePool):
+        self.pool = pool
+
+    def predict(self, pairs, batch_size: int = 32, **kwargs) -> np.ndarray:
+        futures = [self.pool.rerank.submit(c) for c in _chunks(list(pairs), self.pool.rerank.max_batch)]
+        return np.concatenate([np.asarray(f.result(), dtype=np.float32) for f in futures]) if futures else np.zeros(0, dtype=np.float32)
@@ -1,45 +1,119 @@
-import google.generativeai as genai
+import asyncio, json, re, threading, time
 import structlog
-from typing import Dict
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import AsyncIterator, Dict, List, Optional, Protocol, Tuple
 from app.config import settings
 from app.schemas import Course
+from app.services.explain_cache import explanations
+from app.services.metrics import metrics
 
 log = structlog.get_logger()
 
-def init_llm():
-    """Initializes the Gemini model client."""
+
+class LLMBackend(Protocol):
+    """Anything that turns a prompt into text; Gemini in prod, a stub offline."""
+    name: str
+
+    def generate(self, prompt: str, timeout: Optional[float] = None, json_output: bool = False) -> str:
+        """json_output asks for a bare JSON document (plan-level explanations)."""
+        ...
+
+
+class GeminiBackend:
+    name = "gemini"
+
+    def __init__(self, model_name: str):
+        import google.generativeai as genai
+        genai.configure(api_key=settings.GOOGLE_API_KEY)
+        self.model_name = model_name
+        self.model = genai.GenerativeModel(model_name)
+
+    def generate(self, prompt: str, timeout: Optional[float] = None, json_output: bool = False) -> str:
+        opts = {"request_options": {"timeout": timeout}} if timeout else {}
+        if json_output:
+            opts["generation_config"] = {"response_mime_type": "application/json"}
+        response = self.model.generate_content(prompt, **opts)
+        return response.text.strip()
+
+
+class StubBackend:
+    """Deterministic local stand-in for Gemini (tests, benchmarks, offline dev)."""
+    name = "stub"
+
+    def __init__(self, latency_sec: float = 0.0):
+        self.latency_sec = latency_sec
+
+    def generate(self, prompt: str, timeout: Optional[float] = None, json_output: bool = False) -> str:
+        if self.latency_sec:
+            time.sleep(self.latency_sec)
+        if json_output:
+            return json.dumps({cid: self._why(title) for cid, title in _PLAN_COURSE.findall(prompt)})
+        title = next((l.split(":", 1)[1].strip() for l in prompt.splitlines() if "- Title:" in l), "this course")
+        return self._why(title)
+
+    @staticmethod
+    def _why(title: str) -> str:
+        return f"{title} closes the skill gaps on your path to the goal role."
+
+
+def init_llm() -> Optional[LLMBackend]:
+    """Initializes the configured LLM backend (LLM_BACKEND=gemini|stub|none)."""
+    kind = settings.LLM_BACKEND
+    if kind == "stub":
+        log.info("llm_backend_configured", backend="stub")
+        return StubBackend(settings.LLM_STUB_LATENCY_MS / 1000)
+    if kind == "none":
+        return None
     if not settings.GOOGLE_API_KEY:
         log.warning("google_llm_skip", reason="GOOGLE_API_KEY not found in environment.")
         return None
     try:
-        genai.configure(api_key=settings.GOOGLE_API_KEY)
-        # Using gemini-1.5-flash as it's fast and cost-effective for this task
-        model = genai.GenerativeModel('gemini-1.5-flash')
-        log.info("google_llm_configured", model='gemini-1.5-flash')
-        return model
+        # gemini-1.5-flash by default as it's fast and cost-effective for this task
+        backend = GeminiBackend(settings.LLM_MODEL)
+        log.info("google_llm_configured", model=settings.LLM_MODEL)
+        return backend
     except Exception as e:
         log.error("google_llm_init_failed", error=str(e))
         return None
 
-# Initialize the model when the module is loaded
-llm_model = init_llm()
+# Initialized on first use (or by the startup warm-up), not at import:
+# configuring the Gemini SDK is slow and must not delay the process start
+llm_model: Optional[LLMBackend] = None
+_llm_initialized = False
+_llm_lock = threading.Lock()
 
 
-def generate_course_explanation(course: Course, goal_role: str, gap_map: Dict[str, int]) -> str:
-    """Generates a personalized explanation for a course recommendation using Gemini."""
-    
-    # Fallback explanation if LLM is not available or fails
+def get_backend() -> Optional[LLMBackend]:
+    global llm_model, _llm_initialized
+    if not _llm_initialized:
+        with _llm_lock:
+            if not _llm_initialized:
+                llm_model = init_llm()
+                _llm_initialized = True
+    return llm_model
+
+# Shared pool: its size is the process-wide cap on in-flight LLM calls
+_executor = ThreadPoolExecutor(max_workers=settings.LLM_MAX_CONCURRENCY, thread_name_prefix="llm")
+
+
+def set_backend(backend: Optional[LLMBackend]) -> None:
+    """Swap the backend at runtime (e.g. a StubBackend in tests and benchmarks)."""
+    global llm_model, _llm_initialized
+    llm_model = backend
+    _llm_initialized = True
+
+
+def fallback_why(course: Course, goal_role: str, gap_map: Dict[str, int]) -> str:
     gap_keys = set(gap_map.keys())
     covered_skills = set([t.split(":")[0] for t in course.skills]) & gap_keys
-    fallback_why = f"Targets key skills like {', '.join(covered_skills)} to help you progress towards your goal of becoming a {goal_role}."
+    return f"Targets key skills like {', '.join(covered_skills)} to help you progress towards your goal of becoming a {goal_role}."
 
-    if not llm_model:
-        return fallback_why
 
-    gap_skills_str = ", ".join(gap_keys)
+def build_prompt(course: Course, goal_role: str, gap_map: Dict[str, int]) -> str:
+    gap_skills_str = ", ".join(gap_map.keys())
     course_skills_str = ", ".join([s.split(":")[0] for s in course.skills])
 
-    prompt = f"""
+    return f"""
     You are an expert career advisor. Your task is to write a concise, compelling, and personalized explanation (1-2 sentences) for why a specific course is recommended to a user.
 
     **User Profile:**
@@ -54,9 +128,298 @@ def generate_course_explanation(course: Course, goal_role: str, gap_map: Dict[st
     **Your Explanation:**
     """
 
+
+def build_plan_prompt(courses: List[Course], goal_role: str, gap_map: Dict[str, int]) -> str:
+    """One prompt for the whole plan: the role and gap context appear once."""
+    gap_skills_str = ", ".join(gap_map.keys())
+    blocks = "\n".join(
+        f"""    - course_id: {c.course_id}
+      Title: {c.title}
+      Skills Covered: {', '.join(s.split(":")[0] for s in c.skills)}
+      Main Outcomes: {', '.join(c.outcomes)}"""
+        for c in courses)
+
+    return f"""
+    You are an expert career advisor. For each recommended course below, write a concise, compelling, and personalized explanation (1-2 sentences) for why it is recommended to this user.
+
+    **User Profile:**
+    - Goal Role: {goal_role}
+    - Key Skill Gaps to Fill: {gap_skills_str}
+
+    **Recommended Courses:**
+{blocks}
+
+    Respond with a JSON object only, mapping each course_id to its explanation, e.g. {{"C101": "..."}}.
+    """
+
+# "- course_id: C101" followed by its "Title:" line, as written by build_plan_prompt
+_PLAN_COURSE = re.compile(r"- course_id: (\S+)\s*\n\s*Title: ([^\n]*)")
+
+
+def parse_plan_explanations(text: str, course_ids: List[str]) -> Dict[str, str]:
+    """course_id -> explanation from a plan-level response; unknown ids,
+    non-string or empty values are dropped. Tolerates code fences and prose
+    around the JSON object, and a [{"course_id", "why"}] list."""
+    start, end = text.find("{"), text.rfind("}")
+    if text.lstrip().startswith("[") or start < 0:
+        start, end = text.find("["), text.rfind("]")
     try:
-        response = llm_model.generate_content(prompt)
-        return response.text.strip()
+        data = json.loads(text[start:end + 1]) if start >= 0 else None
+    except ValueError:
+        data = None
+    if isinstance(data, list):
+        data = {d.get("course_id"): d.get("why") or d.get("explanation")
+                for d in data if isinstance(d, dict)}
+    if not isinstance(data, dict):
+        return {}
+    wanted = set(course_ids)
+    return {k: v.strip() for k, v in data.items() if k in wanted and isinstance(v, str) and v.strip()}
+
+
+def _count_call(prompt: str) -> None:
+    metrics.incr("llm_calls")
+    metrics.incr("llm_prompt_chars", len(prompt))
+
+
+def _llm_explain_plan(courses: List[Course], goal_role: str, gap_map: Dict[str, int],
+                      timeout: Optional[float] = None) -> Dict[int, str]:
+    """One backend call for several courses; index -> text for the entries that
+    came back well-formed (each is cached). Anything missing is left to the caller."""
+    backend = get_backend()
+    if not backend or not courses:
+        return {}
+    prompt = build_plan_prompt(courses, goal_role, gap_map)
+    _count_call(prompt)
+    try:
+        text = backend.generate(prompt, timeout=timeout, json_output=True)
+    except Exception as e:
+        log.error("gemini_api_call_failed", backend=backend.name, course_ids=[c.course_id for c in courses], error=str(e))
+        return {}
+    got = parse_plan_explanations(text or "", [c.course_id for c in courses])
+    out = {}
+    for i, c in enumerate(courses):
+        if c.course_id in got:
+            out[i] = got[c.course_id]
+            explanations.put(c, goal_role, gap_map, out[i])
+    if len(out) < len(courses):
+        metrics.incr("llm_plan_entries_missing", len(courses) - len(out))
+        log.warning("llm_plan_response_incomplete", backend=backend.name, expected=len(courses), parsed=len(out))
+    return out
+
+
+def _llm_explain_many(courses: List[Course], goal_role: str, gap_map: Dict[str, int],
+                      timeout: Optional[float] = None) -> Dict[int, str]:
+    """Plan mode (LLM_EXPLAIN_MODE=plan): one call explains every course."""
+    if len(courses) > 1:
+        return _llm_explain_plan(courses, goal_role, gap_map, timeout)
+    text = _llm_explain(courses[0], goal_role, gap_map, timeout) if courses else None
+    return {0: text} if text else {}
+
+
+def _llm_explain(course: Course, goal_role: str, gap_map: Dict[str, int],
+                 timeout: Optional[float] = None) -> Optional[str]:
+    """One backend call; successful text is cached, failures return None."""
+    backend = get_backend()
+    if not backend:
+        return None
+    prompt = build_prompt(course, goal_role, gap_map)
+    _count_call(prompt)
+    try:
+        text = backend.generate(prompt, timeout=timeout)
     except Exception as e:
-        log.error("gemini_api_call_failed", course_id=course.course_id, error=str(e))
-        return fallback_why # Return the safe fallback on API error
\ No newline at end of file
+        log.error("gemini_api_call_failed", backend=backend.name, course_id=course.course_id, error=str(e))
+        return None
+    if text:
+        explanations.put(course, goal_role, gap_map, text)
+    return text or None
+
+
+def generate_course_explanation(course: Course, goal_role: str, gap_map: Dict[str, int],
+                                timeout: Optional[float] = None) -> str:
+    """Generates a personalized explanation for a course recommendation using the LLM backend."""
+    cached = explanations.get(course, goal_role, gap_map)
+    if cached:
+        return cached
+    # Fallback explanation if LLM is not available or fails
+    return _llm_explain(course, goal_role, gap_map, timeout) or fallback_why(course, goal_role, gap_map)
+
+
+def generate_explanations(courses: List[Course], goal_role: str, gap_map: Dict[str, int],
+                          deadline_sec: Optional[float] = None) -> List[str]:
+    """Explains every course concurrently; anything not done by the deadline gets fallback_why."""
+    return generate_explanations_many([(courses, goal_role, gap_map)], deadline_sec)[0]
+
+
+async def agenerate_explanations(courses: List[Course], goal_role: str, gap_map: Dict[str, int],
+                                 deadline_sec: Optional[float] = None) -> List[str]:
+    """Awaitable generate_explanations: LLM calls run on the shared pool, the loop stays free."""
+    t0 = time.perf_counter()
+    try:
+        return await _agenerate_explanations(courses, goal_role, gap_map, deadline_sec)
+    finally:
+        metrics.observe("llm", time.perf_counter() - t0)
+
+
+async def _acached(courses: List[Course], goal_role: str, gap_map: Dict[str, int]) -> List[Optional[str]]:
+    """Cached texts per course: the memory tier inline, the SQLite tier (one
+    query for the request's misses) off the event loop, since its lock is
+    also held by LLM threads writing results."""
+    out = [explanations.get_memory(c, goal_role, gap_map) for c in courses]
+    miss = [i for i, text in enumerate(out) if text is None]
+    if miss and explanations.has_disk:
+        got = await asyncio.get_running_loop().run_in_executor(
+            None, explanations.get_many, [(courses[i], goal_role, gap_map) for i in miss])
+        for i, text in zip(miss, got):
+            out[i] = text
+    return out
+
+
+async def _agenerate_explanations(courses: List[Course], goal_role: str, gap_map: Dict[str, int],
+                                  deadline_sec: Optional[float]) -> List[str]:
+    deadline_sec = settings.LLM_DEADLINE_SEC if deadline_sec is None else deadline_sec
+    out: List[Optional[str]] = await _acached(courses, goal_role, gap_map)
+    todo = [i for i, text in enumerate(out) if text is None]
+    if todo and get_backend() and settings.LLM_EXPLAIN_MODE == "plan":
+        f = asyncio.get_running_loop().run_in_executor(
+            _executor, _llm_explain_many, [courses[i] for i in todo], goal_role, gap_map, deadline_sec)
+        done, _ = await asyncio.wait([f], timeout=deadline_sec)
+        if done and f.exception() is None:
+            for j, text in f.result().items():
+                out[todo[j]] = text
+        else:
+            f.cancel()
+            log.warning("llm_deadline_missed", course_ids=[courses[i].course_id for i in todo], deadline_sec=deadline_sec)
+    elif todo and get_backend():
+        loop = asyncio.get_running_loop()
+        futures = {i: loop.run_in_executor(_executor, _llm_explain, courses[i], goal_role, gap_map, deadline_sec)
+                   for i in todo}
+        await asyncio.wait(futures.values(), timeout=deadline_sec)
+        for i, f in futures.items():
+            if f.done() and not f.cancelled() and f.exception() is None:
+                out[i] = f.result()
+            else:
+                f.cancel()
+                log.warning("llm_deadline_missed", course_id=courses[i].course_id, deadline_sec=deadline_sec)
+    return [text or fallback_why(c, goal_role, gap_map) for c, text in zip(courses, out)]
+
+
+async def astream_explanations(courses: List[Course], goal_role: str, gap_map: Dict[str, int],
+                               deadline_sec: Optional[float] = None) -> AsyncIterator[Tuple[int, str, str]]:
+    """Yields (index, text, source) per course as soon as its explanation is ready.
+
+    source is "cache", "llm" or "fallback". Cached texts come first, then LLM
+    results in completion order (in plan mode, together when the single call
+    returns); whatever misses the deadline falls back.
+    Closing the iterator early (client went away) cancels pending calls.
+    """
+    deadline_sec = settings.LLM_DEADLINE_SEC if deadline_sec is None else deadline_sec
+    t0 = time.perf_counter()
+    pending = {}
+    try:
+        todo = []
+        for i, cached in enumerate(await _acached(courses, goal_role, gap_map)):
+            if cached:
+                yield i, cached, "cache"
+            else:
+                todo.append(i)
+        if todo and get_backend() and settings.LLM_EXPLAIN_MODE == "plan":
+            f = asyncio.get_running_loop().run_in_executor(
+                _executor, _llm_explain_many, [courses[i] for i in todo], goal_role, gap_map, deadline_sec)
+            pending = {f: None}
+            done, _ = await asyncio.wait(pending, timeout=max(0.0, t0 + deadline_sec - time.perf_counter()))
+            if not done:
+                log.warning("llm_deadline_missed", course_ids=[courses[i].course_id for i in todo], deadline_sec=deadline_sec)
+            got = f.result() if done and f.exception() is None else {}
+            pending = {}
+            for j, i in enumerate(todo):
+                text = got.get(j)
+                yield i, text or fallback_why(courses[i], goal_role, gap_map), "llm" if text else "fallback"
+            todo = []
+        elif todo and get_backend():
+            loop = asyncio.get_running_loop()
+            pending = {loop.run_in_executor(_executor, _llm_explain, courses[i], goal_role, gap_map, deadline_sec): i
+                       for i in todo}
+            end = t0 + deadline_sec
+            while pending:
+                done, _ = await asyncio.wait(pending, timeout=max(0.0, end - time.perf_counter()),
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    break
+                for f in done:
+                    i = pending.pop(f)
+                    text = f.result() if f.exception() is None else None
+                    yield i, text or fallback_why(courses[i], goal_role, gap_map), "llm" if text else "fallback"
+            for f, i in pending.items():
+                log.warning("llm_deadline_missed", course_id=courses[i].course_id, deadline_sec=deadline_sec)
+            todo = list(pending.values())
+        for i in todo:
+            yield i, fallback_why(courses[i], goal_role, gap_map), "fallback"
+        pending = {}
+    finally:
+        for f in pending:
+            f.cancel()
+        metrics.observe("llm", time.perf_counter() - t0)
+
+
+def generate_explanations_many(jobs: List[Tuple[List[Course], str, Dict[str, int]]],
+                               deadline_sec: Optional[float] = None,
+                               executor: Optional[ThreadPoolExecutor] = None) -> List[List[str]]:
+    """generate_explanations for several plans at once, sharing one deadline.
+
+    `executor` runs the LLM calls instead of the shared pool (background
+    work such as exports uses its own, so it cannot starve /advise).
+    """
+    with metrics.timer("llm"):
+        return _generate_explanations_many(jobs, deadline_sec, executor or _executor)
+
+
+def _generate_explanations_many(jobs: List[Tuple[List[Course], str, Dict[str, int]]],
+                                deadline_sec: Optional[float], pool: ThreadPoolExecutor) -> List[List[str]]:
+    deadline_sec = settings.LLM_DEADLINE_SEC if deadline_sec is None else deadline_sec
+    flat = explanations.get_many([(c, role, gaps) for courses, role, gaps in jobs for c in courses])
+    it = iter(flat)
+    out: List[List[Optional[str]]] = [[next(it) for _ in courses] for courses, _, _ in jobs]
+    todo = [(i, j) for i, row in enumerate(out) for j, text in enumerate(row) if text is None]
+    if todo and get_backend():
+        plan_mode = settings.LLM_EXPLAIN_MODE == "plan"
+        # identical inputs (same courses, role and missing skills, as in the
+        # cache key) share one call: call key -> [(job, course positions)]
+        calls: Dict[Tuple, List[Tuple[int, List[int]]]] = {}
+        if plan_mode:
+            by_job: Dict[int, List[int]] = {}
+            for i, j in todo:
+                by_job.setdefault(i, []).append(j)
+            for i, js in by_job.items():
+                courses, role, gaps = jobs[i]
+                calls.setdefault((tuple(courses[j].course_id for j in js), role, tuple(sorted(gaps))), []).append((i, js))
+        else:
+            for i, j in todo:
+                courses, role, gaps = jobs[i]
+                calls.setdefault(((courses[j].course_id,), role, tuple(sorted(gaps))), []).append((i, [j]))
+        n_jobs = len(by_job) if plan_mode else len(todo)
+        if n_jobs > len(calls):
+            metrics.incr("llm_calls_deduped", n_jobs - len(calls))
+        futures = {}
+        for key, targets in calls.items():
+            i, js = targets[0]
+            courses, role, gaps = jobs[i]
+            if plan_mode:
+                futures[key] = pool.submit(_llm_explain_many, [courses[j] for j in js], role, gaps, deadline_sec)
+            else:
+                futures[key] = pool.submit(_llm_explain, courses[js[0]], role, gaps, deadline_sec)
+        wait(futures.values(), timeout=deadline_sec)
+        for key, f in futures.items():
+            if not f.done():
+                f.cancel()
+                log.warning("llm_deadline_missed", course_ids=list(key[0]), deadline_sec=deadline_sec)
+                continue
+            if f.exception() is not None:
+                log.error("llm_explain_failed", course_ids=list(key[0]), error=str(f.exception()))
+                continue
+            got = f.result() if plan_mode else {0: f.result()}
+            for i, js in calls[key]:
+                for k, text in got.items():
+                    if text:
+                        out[i][js[k]] = text
+    return [[text or fallback_why(c, role, gaps) for c, text in zip(courses, row)]
+            for (courses, role, gaps), row in zip(jobs, out)]
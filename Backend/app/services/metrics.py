@@ -1,35 +1,217 @@
 #app/services/metrics.py
-import time, statistics, uuid
-from typing import Dict
+import math, threading, time, uuid
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional
+from app.services import profiling
+
+# Pipeline stages with their own latency histograms
+STAGES = ("gap", "bm25", "dense", "fusion", "rerank", "planning", "llm", "pdf")
+
+_MIN_SEC = 1e-5
+_GROWTH = 2 ** 0.125
+_N_BUCKETS = 200
+
+
+class Histogram:
+    """Fixed-memory, thread-safe latency histogram with log-spaced buckets.
+
+    Buckets grow by 2**(1/8) (~4.5% worst-case quantile error) from 10us to
+    ~3 min, so memory is a few hundred ints whatever the traffic.
+    """
+    MIN_SEC, GROWTH, N_BUCKETS = _MIN_SEC, _GROWTH, _N_BUCKETS
+    _LOG_G = math.log(_GROWTH)
+    BOUNDS = [_MIN_SEC * _GROWTH ** i for i in range(_N_BUCKETS)]  # upper bounds; last slot = overflow
+
+    def __init__(self):
+        self._counts = [0] * (self.N_BUCKETS + 1)
+        self._lock = threading.Lock()
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, sec: float) -> None:
+        if sec <= self.MIN_SEC:
+            i = 0
+        else:
+            i = min(self.N_BUCKETS, math.ceil(math.log(sec / self.MIN_SEC) / self._LOG_G - 1e-9))
+        with self._lock:
+            self._counts[i] += 1
+            self.count += 1
+            self.sum += sec
+
+    def quantile(self, q: float) -> float:
+        with self._lock:
+            counts, total = list(self._counts), self.count
+        if not total:
+            return 0.0
+        rank, seen = q * total, 0
+        for i, c in enumerate(counts):
+            seen += c
+            if seen >= rank and c:
+                if i >= self.N_BUCKETS:
+                    return self.BOUNDS[-1]
+                # geometric middle of the bucket
+                return self.BOUNDS[i] / math.sqrt(self.GROWTH) if i else self.MIN_SEC
+        return self.BOUNDS[-1]
+
+    def summary(self) -> Dict:
+        n = self.count
+        return {
+            "count": n,
+            "avg_sec": round(self.sum / n, 6) if n else 0.0,
+            "p50_sec": round(self.quantile(0.50), 6),
+            "p95_sec": round(self.quantile(0.95), 6),
+            "p99_sec": round(self.quantile(0.99), 6),
+        }
+
+    def cumulative(self, every: int = 8) -> List:
+        """(le, cumulative count) pairs on a coarser grid for Prometheus."""
+        with self._lock:
+            counts = list(self._counts)
+        out, acc = [], 0
+        for i in range(self.N_BUCKETS):
+            acc += counts[i]
+            if i % every == 0:
+                out.append((self.BOUNDS[i], acc))
+        out.append((math.inf, acc + counts[-1]))
+        return out
+
 
 class Metrics:
     def __init__(self):
-        self.latencies = []  # seconds
-        self.errors = 0
+        self._lock = threading.Lock()
+        self.errors = 0     # unhandled exceptions and 5xx responses (non_200_rate)
+        self.client_errors = 0  # 4xx responses, reported apart
         self.requests = 0
+        self.latency = Histogram()                  # all requests
+        self.routes: Dict[str, Histogram] = {}
+        self.stages: Dict[str, Histogram] = {s: Histogram() for s in STAGES}
+        self.status: Dict[tuple, int] = {}          # (route, status) -> count
+        self.counters: Dict[str, int] = {}          # named events, e.g. rerank_truncated
+
+    def reset(self) -> None:
+        """Drop everything recorded so far (benchmarks measure one phase at a time)."""
+        with self._lock:
+            self.errors = self.client_errors = self.requests = 0
+            self.latency = Histogram()
+            self.routes = {}
+            self.stages = {s: Histogram() for s in STAGES}
+            self.status = {}
+            self.counters = {}
 
     def start(self):
-        self.requests += 1
+        with self._lock:
+            self.requests += 1
         return time.perf_counter()
 
-    def end(self, t0):
+    def end(self, t0, route: Optional[str] = None, status: int = 200):
         dt = time.perf_counter() - t0
-        self.latencies.append(dt)
+        self.latency.observe(dt)
+        route = route or "unmatched"
+        with self._lock:
+            hist = self.routes.get(route)
+            if hist is None:
+                hist = self.routes[route] = Histogram()
+            self.status[(route, status)] = self.status.get((route, status), 0) + 1
+            # unhandled exceptions reach here as the middleware's 500
+            if status >= 500:
+                self.errors += 1
+            elif status >= 400:
+                self.client_errors += 1
+        hist.observe(dt)
         return dt
 
-    def error(self):
-        self.errors += 1
+    def error(self) -> None:
+        """Counts a server error outside of end() (e.g. a failure after the response started)."""
+        with self._lock:
+            self.errors += 1
+
+    def incr(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def _stage(self, stage: str) -> Histogram:
+        hist = self.stages.get(stage)
+        if hist is None:
+            with self._lock:
+                hist = self.stages.setdefault(stage, Histogram())
+        return hist
+
+    def observe(self, stage: str, sec: float) -> None:
+        self._stage(stage).observe(sec)
+        profiling.record(stage, sec)
+
+    @contextmanager
+    def timer(self, stage: str):
+        """Stage histogram, plus a nested span when the request is profiled."""
+        t0 = time.perf_counter()
+        try:
+            with profiling.span(stage):
+                yield
+        finally:
+            self._stage(stage).observe(time.perf_counter() - t0)
 
     def snapshot(self) -> Dict:
-        lat = self.latencies[-200:]  # recent window
-        p95 = statistics.quantiles(lat, n=20)[-1] if len(lat) >= 20 else (max(lat) if lat else 0.0)
         return {
             "requests": self.requests,
             "non_200_rate": (self.errors / self.requests) if self.requests else 0.0,
-            "p95_latency_sec": round(p95, 4),
-            "avg_latency_sec": round(sum(lat)/len(lat), 4) if lat else 0.0
+            "client_error_rate": (self.client_errors / self.requests) if self.requests else 0.0,
+            "p95_latency_sec": round(self.latency.quantile(0.95), 4),
+            "avg_latency_sec": round(self.latency.sum / self.latency.count, 4) if self.latency.count else 0.0,
+            "routes": {r: h.summary() for r, h in sorted(self.routes.items())},
+            "stages": {s: h.summary() for s, h in self.stages.items() if h.count},
+            "counters": dict(sorted(self.counters.items())),
         }
 
+    def prometheus(self, caches: Optional[Dict[str, Dict]] = None) -> str:
+        """Prometheus text exposition (format 0.0.4)."""
+        lines = [
+            "# HELP advisor_requests_total HTTP requests by route and status.",
+            "# TYPE advisor_requests_total counter",
+        ]
+        # snapshot every dict a concurrent request may grow while we render
+        with self._lock:
+            status = dict(self.status)
+            routes = sorted(self.routes.items())
+            stages = list(self.stages.items())
+            counters = dict(self.counters)
+        for (route, code), n in sorted(status.items()):
+            lines.append(f'advisor_requests_total{{route="{_esc(route)}",status="{code}"}} {n}')
+        lines += _histogram_lines("advisor_request_duration_seconds", "Request latency by route.",
+                                  "route", routes)
+        lines += _histogram_lines("advisor_stage_duration_seconds", "Pipeline stage latency.",
+                                  "stage", stages)
+        lines += ["# HELP advisor_events_total Named pipeline events.", "# TYPE advisor_events_total counter"]
+        for name, n in sorted(counters.items()):
+            lines.append(f'advisor_events_total{{event="{_esc(name)}"}} {n}')
+        # one contiguous family per cache field
+        for field, help_text in (("hits", "Cache hits."), ("misses", "Cache misses."), ("size", "Entries in the cache.")):
+            samples = [(name, st[field]) for name, st in (caches or {}).items() if field in st]
+            if not samples:
+                continue
+            lines += [f"# HELP advisor_cache_{field} {help_text}", f"# TYPE advisor_cache_{field} gauge"]
+            lines += [f'advisor_cache_{field}{{cache="{_esc(name)}"}} {v}' for name, v in samples]
+        return "\n".join(lines) + "\n"
+
+
+def _esc(v: str) -> str:
+    return v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _fmt(v: float) -> str:
+    return "+Inf" if v == math.inf else f"{v:.6g}"
+
+
+def _histogram_lines(name: str, help_text: str, label: str, series: Iterable) -> List[str]:
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+    for key, hist in series:
+        lab = f'{label}="{_esc(key)}"'
+        for le, n in hist.cumulative():
+            lines.append(f'{name}_bucket{{{lab},le="{_fmt(le)}"}} {n}')
+        lines.append(f"{name}_sum{{{lab}}} {hist.sum:.6f}")
+        lines.append(f"{name}_count{{{lab}}} {hist.count}")
+    return lines
+
+
 metrics = Metrics()
 
 def new_trace_id() -> str:
@@ -1,12 +1,40 @@
-#app/services/metrics.py
+#app/services/pdf.py
 
-from reportlab.lib.pagesizes import A4
-from reportlab.pdfgen import canvas
-from reportlab.lib.units import cm
-from reportlab.lib.colors import black, HexColor
+import hashlib, io, json
+from typing import Dict, Iterable
+
+def plan_digest(name, goal, plan, gap_map, timeline) -> str:
+    """Content address of a rendered plan: same inputs -> same PDF."""
+    raw = json.dumps([name, goal, plan, gap_map, timeline], sort_keys=True, separators=(",", ":"), default=list)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+def render_plan_pdf_bytes(name, goal, plan, gap_map, timeline) -> bytes:
+    buf = io.BytesIO()
+    render_plan_pdf(buf, name, goal, plan, gap_map, timeline)
+    return buf.getvalue()
 
 def render_plan_pdf(path, name, goal, plan, gap_map, timeline):
+    # `path` may be a filename or any binary file-like object
+    # reportlab loads on the first render, not at app start
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfgen import canvas
     c = canvas.Canvas(path, pagesize=A4)
+    _draw_plan(c, name, goal, plan, gap_map, timeline)
+    c.save()
+
+def render_plans_pdf(path, pages: Iterable[Dict]):
+    """Several plans in one document, one page each (pages: render_plan_pdf kwargs)."""
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfgen import canvas
+    c = canvas.Canvas(path, pagesize=A4)
+    for page in pages:
+        _draw_plan(c, **page)
+    c.save()
+
+def _draw_plan(c, name, goal, plan, gap_map, timeline):
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.units import cm
+    from reportlab.lib.colors import black
     w, h = A4
     y = h - 2*cm
 
@@ -43,4 +71,4 @@ def render_plan_pdf(path, name, goal, plan, gap_map, timeline):
         c.drawString(2*cm, y, f"{cid}: weeks {s}-{e}")
         y -= 0.5*cm
 
-    c.showPage(); c.save()
+    c.showPage()
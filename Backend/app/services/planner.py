@@ -1,9 +1,20 @@
 #app/services/planner.py
 
-from typing import Dict, List, Tuple
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
 from app.schemas import Course, JD, Profile
 from app.models import RetrievedDoc
 
+if hasattr(np, "bitwise_count"):  # numpy >= 2.0
+    def _popcount(words: np.ndarray) -> np.ndarray:
+        return np.bitwise_count(words).sum(axis=-1, dtype=np.int64)
+else:
+    _POP8 = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+    def _popcount(words: np.ndarray) -> np.ndarray:
+        b = np.ascontiguousarray(words).view(np.uint8)
+        return _POP8[b].sum(axis=-1, dtype=np.int64)
+
 def parse_skill_tag(tag: str) -> Tuple[str, int]:
     # "python:b" -> ("python", 1)  (b=1, i=2, a=3)
     if ":" not in tag: return (tag, 1)
@@ -19,6 +30,10 @@ def compute_gap_map(jd: JD, profile: Profile) -> Dict[str,int]:
         if delta>0: gaps[skill] = delta
     return gaps
 
+def gap_signature(gap_map: Dict[str,int]) -> Tuple[Tuple[str,int], ...]:
+    # order-independent, hashable form of a gap map (cache / dedupe key)
+    return tuple(sorted(gap_map.items()))
+
 def score_path(courses: List[Course], gap_map: Dict[str,int]) -> float:
     cover = set()
     all_sk = []
@@ -31,23 +46,151 @@ def score_path(courses: List[Course], gap_map: Dict[str,int]) -> float:
     overlap_penalty = max(0, len(all_sk) - len(set(all_sk)))
     return 3*len(cover) - overlap_penalty - 0.1*dur
 
-def pick_path(courses: List[Course], gap_map: Dict[str,int]) -> List[Course]:
-    # Greedy: pick 3 courses maximizing marginal coverage, respecting simple prereqs
-    chosen: List[Course] = []
-    need = set(gap_map.keys())
-    pool = courses[:]
-    while len(chosen)<3 and pool:
-        best, best_gain, best_score = None, -1, -1
-        for c in pool:
-            c_sk = set(parse_skill_tag(t)[0] for t in c.skills)
-            gain = len(need & c_sk)
-            s = score_path(chosen + [c], gap_map)
-            if (gain, s) > (best_gain, best_score):
-                best, best_gain, best_score = c, gain, s
-        chosen.append(best)
-        pool.remove(best)
-        need -= set(parse_skill_tag(t)[0] for t in best.skills)
-    return chosen[:3]
+class SkillIndex:
+    """Per-course skill bitmasks over a pool of candidate courses.
+
+    Skills are interned to bit positions; row i of `words` is course i's skill
+    set as little-endian uint64 words, so path scoring is AND/OR + popcount.
+    score_path ignores levels, so none are kept here; the catalog-wide
+    (course x skill) level matrix lives in CourseStore.levels, built once
+    per load, and from_store() reads the masks straight out of it.
+    """
+
+    def __init__(self, courses: Iterable[Course]):
+        self.skill_ids: Dict[str, int] = {}
+        self.rows: Dict[str, int] = {}
+        self.courses: List[Course] = []
+        parsed = []
+        for c in courses:
+            if c.course_id in self.rows:
+                continue
+            self.rows[c.course_id] = len(self.courses)
+            self.courses.append(c)
+            tags = [parse_skill_tag(t)[0] for t in c.skills]
+            parsed.append([self.skill_ids.setdefault(k, len(self.skill_ids)) for k in tags])
+        n, n_words = len(self.courses), max(1, (len(self.skill_ids) + 63) // 64)
+        self.words = np.zeros((n, n_words), dtype=np.uint64)
+        for i, tags in enumerate(parsed):
+            for sid in tags:
+                self.words[i, sid >> 6] |= np.uint64(1 << (sid & 63))
+        self.n_tags = np.array([len(t) for t in parsed], dtype=np.int64)
+        self.duration = np.array([c.duration_weeks for c in self.courses], dtype=np.int64)
+
+    @classmethod
+    def from_store(cls, store, rows: np.ndarray) -> "SkillIndex":
+        """Index over some rows of a CourseStore, read from its interned tags (no parsing).
+
+        Row i of the index is store row rows[i]. Bits are numbered over the
+        skills those rows use only, so masks stay a word or two wide however
+        large the catalog's vocabulary is.
+        """
+        out = cls.__new__(cls)
+        rows = np.asarray(rows, dtype=np.int64)
+        sub = store.levels[rows]
+        used = np.unique(sub.indices)
+        local = np.searchsorted(used, sub.indices)
+        out.skill_ids = {store.skills.names[s]: i for i, s in enumerate(used.tolist())}
+        out.rows = {store.ids[r]: i for i, r in enumerate(rows.tolist())}
+        out.words = np.zeros((len(rows), max(1, (len(used) + 63) // 64)), dtype=np.uint64)
+        course = np.repeat(np.arange(len(rows)), np.diff(sub.indptr))
+        np.bitwise_or.at(out.words, (course, local >> 6),
+                         np.left_shift(np.uint64(1), (local & 63).astype(np.uint64)))
+        out.n_tags = store.n_tags[rows].astype(np.int64)
+        out.duration = store.duration[rows].astype(np.int64)
+        return out
+
+    def __contains__(self, course_id: str) -> bool:
+        return course_id in self.rows
+
+    def gap_words(self, gap_map: Dict[str,int]) -> np.ndarray:
+        w = np.zeros(self.words.shape[1], dtype=np.uint64)
+        for k in gap_map:
+            sid = self.skill_ids.get(k)
+            if sid is not None:
+                w[sid >> 6] |= np.uint64(1 << (sid & 63))
+        return w
+
+    def gains(self, rows: np.ndarray, union: np.ndarray, gap: np.ndarray) -> np.ndarray:
+        """10x marginal score_path gain of adding each row to a path whose skills are `union`.
+
+        Integer units (x10) keep the 0.1*duration term exact. Gains never grow
+        as the path grows (coverage and distinct skills are submodular), which
+        is what makes the branch-and-bound upper bound valid.
+        """
+        w = self.words[rows]
+        fresh = w & ~union
+        new_cover = _popcount(fresh & gap)
+        overlap = self.n_tags[rows] - _popcount(fresh)
+        return 30 * new_cover - 10 * overlap - self.duration[rows]
+
+def _search(index: SkillIndex, rows: np.ndarray, gap: np.ndarray, n: int) -> List[int]:
+    """Exact best n-subset of rows under score_path, by depth-first branch and bound."""
+    empty = np.zeros_like(gap)
+    # explore strong courses first so a good incumbent prunes early
+    rows = rows[np.argsort(-index.gains(rows, empty, gap), kind="stable")]
+
+    # incumbent: greedy by marginal gain
+    union, path, val = empty.copy(), [], 0
+    left = list(range(len(rows)))
+    for _ in range(n):
+        g = index.gains(rows[left], union, gap)
+        j = int(np.argmax(g))
+        val += int(g[j]); path.append(left.pop(j))
+        union |= index.words[rows[path[-1]]]
+    best = [val, path]
+
+    def dfs(start: int, union: np.ndarray, val: int, path: List[int]) -> None:
+        r = n - len(path)
+        rest = np.arange(start, len(rows))
+        if len(rest) < r:
+            return
+        g = index.gains(rows[rest], union, gap)
+        if r == 1:
+            j = int(np.argmax(g))
+            if val + g[j] > best[0]:
+                best[0], best[1] = val + int(g[j]), path + [int(rest[j])]
+            return
+        top = np.sort(np.partition(g, len(g) - r)[len(g) - r:])[::-1]
+        if val + top.sum() <= best[0]:
+            return
+        bound_rest = top[: r - 1].sum()  # loose (may double count j) but admissible
+        for j in range(len(rest) - r + 1):
+            if val + g[j] + bound_rest <= best[0]:
+                continue
+            pos = int(rest[j])
+            dfs(pos + 1, union | index.words[rows[pos]], val + int(g[j]), path + [pos])
+
+    dfs(0, empty, 0, [])
+    return [int(rows[p]) for p in best[1]]
+
+def pick_rows(store, rows: Iterable[int], gap_map: Dict[str,int], n: int = 3) -> List[int]:
+    """Best n-course path among CourseStore rows (exact, deterministic); returns store rows."""
+    uniq = np.asarray(list(dict.fromkeys(int(r) for r in rows)), dtype=np.int64)
+    if not len(uniq) or n <= 0:
+        return []
+    index = SkillIndex.from_store(store, uniq)
+    picked = _search(index, np.arange(len(uniq)), index.gap_words(gap_map), min(n, len(uniq)))
+    return [int(uniq[i]) for i in picked]
+
+def pick_path(courses: List[Course], gap_map: Dict[str,int], n: int = 3,
+              store=None) -> List[Course]:
+    """Best n-course path under score_path's objective (exact, deterministic).
+
+    Reads skills from the catalog's CourseStore when every course is in it,
+    else indexes the candidates on the fly.
+    """
+    seen, uniq = set(), []
+    for c in courses:
+        if c.course_id not in seen:
+            seen.add(c.course_id); uniq.append(c)
+    if not uniq or n <= 0:
+        return []
+    if store is not None and all(c.course_id in store for c in uniq):
+        by_row = {store.rows[c.course_id]: c for c in uniq}
+        return [by_row[r] for r in pick_rows(store, by_row, gap_map, n)]
+    index = SkillIndex(uniq)
+    picked = _search(index, np.arange(len(uniq)), index.gap_words(gap_map), min(n, len(uniq)))
+    return [uniq[i] for i in picked]
 
 def build_timeline(courses: List[Course]) -> Tuple[int, List[Tuple[str,int,int]]]:
     # simple sequential schedule honoring prereqs by ordering (we keep chosen order)
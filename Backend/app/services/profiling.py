@@ -0,0 +1,170 @@
+#app/services/profiling.py
+import contextvars, functools, os, random, sys, threading, time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+from app.config import settings
+from app.services.cache import LRUCache
+
+# Profile of the request being handled, if it is profiled; copied into stage
+# threads by bind(). The span stack gives nesting depth.
+_current: contextvars.ContextVar[Optional["RequestProfile"]] = contextvars.ContextVar("profile", default=None)
+_stack: contextvars.ContextVar[Tuple[str, ...]] = contextvars.ContextVar("profile_stack", default=())
+
+
+class RequestProfile:
+    """Timed spans (and optionally sampled stacks) for one request."""
+
+    def __init__(self, trace_id: str, method: str, path: str):
+        self.trace_id = trace_id
+        self.method, self.path = method, path
+        self.started = time.time()
+        self.t0 = time.perf_counter()
+        self.spans: List[Dict] = []     # appended from several threads; list.append is atomic
+        self.sampler: Optional[StackSampler] = None
+        self.status: Optional[int] = None
+        self.ms: Optional[float] = None
+
+    def add(self, name: str, start: float, end: float, depth: int) -> None:
+        self.spans.append({
+            "name": name,
+            "start_ms": round((start - self.t0) * 1000, 3),
+            "ms": round((end - start) * 1000, 3),
+            "depth": depth,
+            "thread": threading.current_thread().name,
+        })
+
+    def breakdown(self) -> Dict[str, float]:
+        """Total ms per span name (the request_log summary)."""
+        out: Dict[str, float] = {}
+        for s in self.spans:
+            out[s["name"]] = round(out.get(s["name"], 0.0) + s["ms"], 3)
+        return out
+
+    def to_dict(self) -> Dict:
+        out = {
+            "trace_id": self.trace_id,
+            "method": self.method,
+            "path": self.path,
+            "status": self.status,
+            "ms": self.ms,
+            "started": self.started,
+            "spans": sorted(self.spans, key=lambda s: s["start_ms"]),
+            "breakdown": self.breakdown(),
+        }
+        if self.sampler is not None:
+            out["stacks"] = self.sampler.result()
+        return out
+
+
+class StackSampler(threading.Thread):
+    """Stdlib sampling profiler: every interval, the Python stack of each busy
+    thread is recorded in folded form ("outer;...;leaf" -> samples).
+
+    It sees the whole process, so stacks of concurrent requests show up too;
+    the request's own stage threads are named in its spans.
+    """
+    _IDLE = {"threading.py", "selectors.py", "queue.py"}    # leaf frames of parked threads
+
+    def __init__(self, interval_ms: float, max_depth: int = 48):
+        super().__init__(daemon=True, name="profile-sampler")
+        self.interval = max(0.001, interval_ms / 1000)
+        self.max_depth = max_depth
+        self.samples: Counter = Counter()
+        self.ticks = 0
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        me = threading.get_ident()
+        while not self._stop_event.wait(self.interval):
+            self.ticks += 1
+            for tid, frame in sys._current_frames().items():
+                if tid == me or os.path.basename(frame.f_code.co_filename) in self._IDLE:
+                    continue
+                names = []
+                while frame is not None and len(names) < self.max_depth:
+                    code = frame.f_code
+                    names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                self.samples[";".join(reversed(names))] += 1
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self.join(timeout=1)
+
+    def result(self, top: int = 50) -> Dict:
+        return {
+            "interval_ms": round(self.interval * 1000, 3),
+            "ticks": self.ticks,
+            "folded": [{"stack": s, "samples": n} for s, n in self.samples.most_common(top)],
+        }
+
+
+# trace_id -> finished RequestProfile, oldest dropped first
+profiles = LRUCache(settings.PROFILE_RING_SIZE)
+
+
+def wanted(header: str) -> Tuple[bool, bool]:
+    """(profile spans?, sample stacks?) for a request, from its X-Profile
+    header value ("1"/"spans", or "cpu" for stacks too) or PROFILE_SAMPLE_RATE."""
+    header = header.strip().lower()
+    if header in ("cpu", "stacks"):
+        return True, True
+    if header in ("1", "true", "spans"):
+        return True, False
+    rate = settings.PROFILE_SAMPLE_RATE
+    return (rate > 0 and random.random() < rate), False
+
+
+def start(trace_id: str, method: str, path: str, stacks: bool = False) -> RequestProfile:
+    prof = RequestProfile(trace_id, method, path)
+    if stacks:
+        prof.sampler = StackSampler(settings.PROFILE_STACK_INTERVAL_MS)
+        prof.sampler.start()
+    _current.set(prof)
+    return prof
+
+
+def finish(prof: RequestProfile, status: int, sec: float) -> None:
+    if prof.sampler is not None:
+        prof.sampler.stop()
+    prof.status, prof.ms = status, round(sec * 1000, 2)
+    _current.set(None)
+    profiles.put(prof.trace_id, prof)
+
+
+def active() -> Optional[RequestProfile]:
+    return _current.get()
+
+
+@contextmanager
+def span(name: str):
+    """Times a nested span into the current request's profile (no-op when not profiled)."""
+    prof = _current.get()
+    if prof is None:
+        yield
+        return
+    stack = _stack.get()
+    token = _stack.set(stack + (name,))
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        prof.add(name, t0, time.perf_counter(), len(stack))
+        _stack.reset(token)
+
+
+def record(name: str, sec: float) -> None:
+    """Adds a span that ended now and lasted sec (for stages timed elsewhere)."""
+    prof = _current.get()
+    if prof is not None:
+        end = time.perf_counter()
+        prof.add(name, end - sec, end, len(_stack.get()))
+
+
+def bind(fn: Callable) -> Callable:
+    """fn wrapped to run in the caller's context, so spans recorded in an
+    executor thread land in the caller's profile."""
+    if _current.get() is None:
+        return fn
+    return functools.partial(contextvars.copy_context().run, fn)
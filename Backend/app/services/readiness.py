@@ -0,0 +1,82 @@
+#app/services/readiness.py
+import threading, time
+from contextlib import contextmanager
+from typing import Dict, Iterable, Optional
+
+
+class Readiness:
+    """Warm-up progress per component (catalog, indexes, models).
+
+    The process is live as soon as it serves HTTP, until fail() records an
+    error it cannot recover from; it is ready once every required component
+    is. Optional components (e.g. the LLM, which has a template fallback) are
+    reported but don't gate readiness.
+    """
+
+    def __init__(self, required: Iterable[str], optional: Iterable[str] = ()):
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self.required = list(required)
+        self.components: Dict[str, Dict] = {
+            name: {"state": "pending", "required": name in self.required}
+            for name in [*self.required, *optional]
+        }
+        self.started = time.time()
+        self.fatal: Optional[str] = None
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    @property
+    def live(self) -> bool:
+        return self.fatal is None
+
+    def fail(self, error: str) -> None:
+        """Warm-up gave up: the process should be restarted."""
+        with self._lock:
+            self.fatal = error
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._ready.wait(timeout)
+
+    def set(self, name: str, state: str, **info) -> None:
+        with self._lock:
+            comp = self.components.setdefault(name, {"required": False})
+            comp.update(info, state=state)
+            if all(self.components[n]["state"] == "ready" for n in self.required):
+                self._ready.set()
+
+    @contextmanager
+    def step(self, name: str):
+        """Marks `name` loading, then ready (with its duration) or failed."""
+        t0 = time.perf_counter()
+        self.set(name, "loading")
+        try:
+            yield
+        except Exception as e:
+            self.set(name, "failed", error=str(e), sec=round(time.perf_counter() - t0, 3))
+            raise
+        self.set(name, "ready", sec=round(time.perf_counter() - t0, 3))
+
+    def reset(self) -> None:
+        with self._lock:
+            self._ready.clear()
+            self.started = time.time()
+            self.fatal = None
+            for name in self.components:
+                self.components[name] = {"state": "pending", "required": name in self.required}
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            comps = {n: dict(c) for n, c in self.components.items()}
+        done = sum(c["state"] == "ready" for c in comps.values())
+        out = {
+            "ready": self.ready,
+            "progress": round(done / max(1, len(comps)), 3),
+            "uptime_sec": round(time.time() - self.started, 3),
+            "components": comps,
+        }
+        if self.fatal:
+            out["fatal"] = self.fatal
+        return out
@@ -0,0 +1,59 @@
+#app/services/singleflight.py
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, TypeVar
+from app.services.metrics import metrics
+
+T = TypeVar("T")
+
+
+class _Call:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Coalesces concurrent identical async computations onto one in-flight task.
+
+    The first caller for a key starts `fn()` as a task; callers arriving
+    while it runs await that same task and get its result or its exception.
+    Each waiter is shielded, so a cancelled waiter (client gone) only stops
+    waiting; the shared task is cancelled once no waiter is left. Nothing is
+    kept after completion, results are cached elsewhere (plan cache).
+
+    Counters: `<name>_coalesced` (callers that joined a running task) and
+    `<name>_abandoned` (tasks cancelled because every waiter left).
+    """
+
+    def __init__(self, name: str, enabled: bool = True):
+        self.name = name
+        self.enabled = enabled
+        self._calls: Dict[Hashable, _Call] = {}
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        if not self.enabled:
+            return await fn()
+        call = self._calls.get(key)
+        if call is None or call.task.done():
+            call = self._calls[key] = _Call(asyncio.ensure_future(fn()))
+            call.task.add_done_callback(lambda _t, key=key, call=call: self._forget(key, call))
+        else:
+            metrics.incr(f"{self.name}_coalesced")
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if not call.waiters and not call.task.done():
+                call.task.cancel()
+                self._forget(key, call)
+                metrics.incr(f"{self.name}_abandoned")
+
+    def _forget(self, key: Hashable, call: _Call) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
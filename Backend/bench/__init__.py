@@ -0,0 +1,5 @@
+"""Offline benchmark harness: synthetic catalogs, micro-benchmarks and an HTTP load test.
+
+Runs without Pinecone, Gemini or model downloads (local vector index, hashing
+embeddings, overlap reranker and stub LLM). See `python -m bench.run --help`.
+"""
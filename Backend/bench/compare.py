@@ -0,0 +1,78 @@
+# bench/compare.py
+"""Diff two bench.run reports and flag regressions.
+
+    python -m bench.compare baseline.json candidate.json --threshold 0.15
+
+Exits 1 if any latency grew, or any throughput dropped, by more than the threshold.
+"""
+import argparse, json, sys
+from typing import Dict, Iterator, Tuple
+
+HIGHER_IS_BETTER = ("ops_per_sec", "throughput_rps")
+LOWER_IS_BETTER = ("_ms", "_sec", "p50", "p95", "p99")
+SKIP = ("count", "n", "requests", "concurrency", "courses", "jds", "synth_sec")
+
+
+def flatten(d: Dict, prefix: str = "") -> Iterator[Tuple[str, float]]:
+    for k, v in d.items():
+        key = f"{prefix}.{k}" if prefix else k
+        if isinstance(v, dict):
+            yield from flatten(v, key)
+        elif isinstance(v, (int, float)) and not isinstance(v, bool):
+            yield key, float(v)
+
+
+def direction(key: str) -> int:
+    """+1 higher is better, -1 lower is better, 0 not a performance number."""
+    leaf = key.rsplit(".", 1)[-1]
+    if leaf in SKIP:
+        return 0
+    if leaf in HIGHER_IS_BETTER:
+        return 1
+    if leaf.endswith(LOWER_IS_BETTER) or leaf in LOWER_IS_BETTER:
+        return -1
+    return 0
+
+
+def compare(base: Dict, cand: Dict, threshold: float, min_abs_ms: float = 0.05):
+    old = dict(flatten(base.get("results", {})))
+    new = dict(flatten(cand.get("results", {})))
+    rows, regressions = [], []
+    for key in sorted(old.keys() & new.keys()):
+        sign = direction(key)
+        a, b = old[key], new[key]
+        if not sign or a == 0:
+            continue
+        change = (b - a) / abs(a)
+        # ignore sub-resolution jitter on tiny latencies
+        if sign < 0 and "_ms" in key and abs(b - a) < min_abs_ms:
+            change = 0.0
+        worse = -sign * change > threshold
+        rows.append((key, a, b, change, worse))
+        if worse:
+            regressions.append(key)
+    return rows, regressions
+
+
+def main(argv=None) -> None:
+    ap = argparse.ArgumentParser(prog="python -m bench.compare")
+    ap.add_argument("baseline")
+    ap.add_argument("candidate")
+    ap.add_argument("--threshold", type=float, default=0.15, help="relative change counted as a regression")
+    ap.add_argument("--all", action="store_true", help="print unchanged metrics too")
+    args = ap.parse_args(argv)
+    with open(args.baseline) as f:
+        base = json.load(f)
+    with open(args.candidate) as f:
+        cand = json.load(f)
+    rows, regressions = compare(base, cand, args.threshold)
+    for key, a, b, change, worse in rows:
+        if args.all or abs(change) > args.threshold:
+            flag = "REGRESSION" if worse else "improved"
+            print(f"{key:60s} {a:12.4f} -> {b:12.4f}  {change:+7.1%}  {flag}")
+    print(f"{len(rows)} metrics compared, {len(regressions)} regressions (threshold {args.threshold:.0%})")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
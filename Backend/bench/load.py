@@ -0,0 +1,82 @@
+# bench/load.py
+"""Concurrent HTTP load test against a uvicorn server started in-process."""
+import asyncio, socket, threading, time
+from typing import Dict, List
+import httpx
+import numpy as np
+import uvicorn
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class ServerThread:
+    """Runs the ASGI app under uvicorn on a background thread (startup hooks included)."""
+
+    def __init__(self, app, port: int = 0):
+        self.port = port or _free_port()
+        self.server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=self.port,
+                                                    log_level="warning", access_log=False))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def __enter__(self) -> "ServerThread":
+        self.t0 = t0 = time.perf_counter()
+        self.thread.start()
+        while not self.server.started:
+            if not self.thread.is_alive():
+                raise RuntimeError("server failed to start")
+            time.sleep(0.01)
+        self.startup_sec = time.perf_counter() - t0
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.server.should_exit = True
+        self.thread.join(timeout=30)
+
+
+async def _drive(url: str, path: str, bodies: List[Dict], concurrency: int) -> Dict:
+    lat: List[float] = []
+    errors = 0
+    queue = iter(enumerate(bodies))
+
+    async def worker(client: httpx.AsyncClient):
+        nonlocal errors
+        for _, body in queue:
+            t0 = time.perf_counter()
+            try:
+                r = await client.post(path, json=body)
+                ok = r.status_code == 200
+            except httpx.HTTPError:
+                ok = False
+            lat.append(time.perf_counter() - t0)
+            errors += not ok
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as client:
+        t0 = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        wall = time.perf_counter() - t0
+    arr = np.asarray(lat) * 1000
+    return {
+        "requests": len(bodies),
+        "concurrency": concurrency,
+        "errors": errors,
+        "duration_sec": round(wall, 3),
+        "throughput_rps": round(len(bodies) / wall, 2) if wall else None,
+        "latency_ms": {
+            "p50": round(float(np.percentile(arr, 50)), 3),
+            "p95": round(float(np.percentile(arr, 95)), 3),
+            "p99": round(float(np.percentile(arr, 99)), 3),
+        } if len(arr) else {},
+    }
+
+
+def run_load(url: str, bodies: List[Dict], concurrency: int, path: str = "/advise") -> Dict:
+    return asyncio.run(_drive(url, path, bodies, concurrency))
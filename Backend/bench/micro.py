@@ -0,0 +1,120 @@
+# bench/micro.py
+"""Micro-benchmarks for the hot pipeline pieces. Import after bench.run.configure()."""
+import random, time
+from typing import Callable, Dict, List
+import numpy as np
+
+
+def timed(fn: Callable[[int], object], n: int, warmup: int = 3) -> Dict:
+    """Call fn(i) n times; report throughput and latency percentiles."""
+    for i in range(min(warmup, n)):
+        fn(i)
+    lat = np.empty(n)
+    t_start = time.perf_counter()
+    for i in range(n):
+        t0 = time.perf_counter()
+        fn(i)
+        lat[i] = time.perf_counter() - t0
+    total = time.perf_counter() - t_start
+    return {
+        "n": n,
+        "ops_per_sec": round(n / total, 2) if total else None,
+        "p50_ms": round(float(np.percentile(lat, 50)) * 1000, 4),
+        "p95_ms": round(float(np.percentile(lat, 95)) * 1000, 4),
+        "p99_ms": round(float(np.percentile(lat, 99)) * 1000, 4),
+    }
+
+
+def bench_bm25(retriever, queries: List[str], n: int) -> Dict:
+    return timed(lambda i: retriever.search(queries[i % len(queries)]), n)
+
+
+def bench_dense(vectorstore, queries: List[str], k: int, n: int) -> Dict:
+    return timed(lambda i: vectorstore.similarity_search(queries[i % len(queries)], k=k), n)
+
+
+def _recall(exact, qv: np.ndarray, ref_scores: np.ndarray, got: np.ndarray) -> float:
+    """Share of returned docs scoring at least the exact k-th score; unlike
+    id overlap, it doesn't penalize swapping equally-scored docs at the cutoff."""
+    hits = []
+    for q, kth, row in zip(qv, ref_scores[:, -1], got):
+        exact_scores = exact.search_vectors(q, len(exact))  # full ranking for this query
+        by_id = dict(zip(exact_scores[0][0].tolist(), exact_scores[1][0].tolist()))
+        hits.append(np.mean([by_id[i] >= kth - 1e-6 for i in row]) if len(row) else 1.0)
+    return float(np.mean(hits))
+
+
+def bench_quantized(vectorstore, queries: List[str], k: int, n: int, rescore_factor: int = 4) -> Dict:
+    """Recall@k of each quantized first pass against exact float32 search, with
+    and without re-scoring, plus scan RAM and latency."""
+    from app.retrieval.local_index import QUANT_KINDS
+    qv = np.asarray(vectorstore.embeddings.embed_documents(list(queries)), dtype=np.float32)
+    exact = vectorstore.with_quantization(None)
+    ref, ref_scores = exact.search_vectors(qv, k)
+    full_bytes = len(exact) * qv.shape[1] * 4
+    out = {"exact": {**timed(lambda i: exact.search_vectors(qv[i % len(qv)], k), n), "ram_bytes": full_bytes}}
+    for kind in QUANT_KINDS:
+        for factor in (1, rescore_factor):
+            store = vectorstore.with_quantization(kind, rescore_factor=factor)
+            got, _ = store.search_vectors(qv, k)
+            recall = _recall(exact, qv, ref_scores, got)
+            out[f"{kind}_x{factor}"] = {
+                **timed(lambda i: store.search_vectors(qv[i % len(qv)], k), n),
+                "recall_at_k": round(float(recall), 4),
+                "ram_bytes": store.memory_bytes(),
+                "ram_ratio": round(store.memory_bytes() / max(1, full_bytes), 3),
+            }
+    return out
+
+
+def bench_rerank(queries: List[str], cand_lists: List[list], topn: int, n: int) -> Dict:
+    from app.retrieval.hybrid import rerank, pair_scores
+
+    def one(i):
+        pair_scores.clear()  # measure inference, not the pair cache
+        rerank(queries[i % len(queries)], cand_lists[i % len(cand_lists)], topn=topn)
+    return timed(one, n)
+
+
+def bench_pick_path(courses: list, gap_maps: List[Dict], store, n_candidates: int, n: int, seed: int = 3) -> Dict:
+    from app.services import planner
+    rng = random.Random(seed)
+    pools = [rng.sample(courses, min(n_candidates, len(courses))) for _ in range(8)]
+    return timed(lambda i: planner.pick_path(pools[i % len(pools)], gap_maps[i % len(gap_maps)], store=store), n)
+
+
+def _deep_size(obj, seen=None) -> int:
+    import sys
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(_deep_size(k, seen) + _deep_size(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set)):
+        size += sum(_deep_size(v, seen) for v in obj)
+    elif hasattr(obj, "__dict__"):
+        size += _deep_size(vars(obj), seen)
+    return size
+
+
+def bench_catalog(store, jds: list, n: int) -> Dict:
+    """Skill-index candidate lookup latency, and the store's RAM against a
+    dict of Course models (measured on a sample, scaled to the catalog)."""
+    needs = [dict(j.skills_required) for j in jds]
+    sample = [store.course(r) for r in range(0, len(store), max(1, len(store) // 2000))]
+    per_course = _deep_size({c.course_id: c for c in sample}) / max(1, len(sample))
+    models_bytes = int(per_course * len(store))
+    return {
+        "gap_candidates": timed(lambda i: store.gap_candidates(needs[i % len(needs)], 20), n),
+        "materialize": timed(lambda i: store.course(i % len(store)), n),
+        "ram_bytes": store.memory_bytes(),
+        "models_ram_bytes": models_bytes,
+        "ram_ratio": round(store.memory_bytes() / max(1, models_bytes), 3),
+    }
+
+
+def bench_pdf(goal: str, plan: List[Dict], gap_map: Dict, timeline: Dict, n: int) -> Dict:
+    from app.services.pdf import render_plan_pdf_bytes
+    return timed(lambda i: render_plan_pdf_bytes("Candidate", goal, plan, gap_map, timeline), n)
@@ -0,0 +1,133 @@
+# bench/run.py
+"""End-to-end benchmark driver.
+
+    python -m bench.run --scales 100,10000 --out bench_results.json
+    python -m bench.compare old.json bench_results.json
+
+Each scale runs in its own process (the app keeps module-level state) with a
+fresh synthetic catalog, stub backends and an in-process uvicorn server.
+"""
+import argparse, json, logging, os, platform, subprocess, sys, tempfile, time
+from typing import Dict, List
+
+# Offline stand-ins; anything already set in the environment wins, so the same
+# harness can be pointed at real models.
+STUB_ENV = {
+    "VECTOR_BACKEND": "local",
+    "EMBEDDING_BACKEND": "hash",
+    "RERANKER_BACKEND": "overlap",
+    "LLM_BACKEND": "stub",
+    "EXPLAIN_CACHE_PATH": "",
+}
+
+
+def configure(data_dir: str) -> None:
+    for k, v in STUB_ENV.items():
+        os.environ.setdefault(k, v)
+    os.environ["DATA_DIR"] = data_dir
+    import structlog
+    structlog.configure(wrapper_class=structlog.make_filtering_bound_logger(logging.WARNING))
+
+
+def run_scale(n_courses: int, args) -> Dict:
+    from bench import synth
+    data_dir = tempfile.mkdtemp(prefix=f"bench_{n_courses}_")
+    t0 = time.perf_counter()
+    synth.generate(data_dir, n_courses, n_jds=args.jds, seed=args.seed)
+    gen_sec = time.perf_counter() - t0
+    configure(data_dir)
+
+    import httpx
+    from app import main as app_main
+    from app.schemas import AdviseRequest
+    from app.services.metrics import metrics
+    from bench import micro
+    from bench.load import ServerThread, run_load
+
+    out: Dict = {"courses": n_courses, "jds": args.jds, "synth_sec": round(gen_sec, 3)}
+    with ServerThread(app_main.app) as server:
+        out["startup_sec"] = round(server.startup_sec, 3)   # accepting connections
+        app_main.readiness.wait(3600)
+        out["ready_sec"] = round(time.perf_counter() - server.t0, 3)  # indexes and models loaded
+        jds = [j.model_dump() for j in app_main.JDS.values()]
+        jd_objs = list(app_main.JDS.values())
+        gap_maps = [dict(j.skills_required) for j in jd_objs]
+        queries = [app_main.plan_query(j, g) for j, g in zip(jd_objs, gap_maps)]
+        courses = list(app_main.COURSES.values())
+        cand_lists = [app_main.hybrid.invoke(q) for q in queries]
+
+        plan = app_main.advise_sync(AdviseRequest(profile={"skills": {}, "years": 1, "goal_role": jd_objs[0].role}))
+        out["micro"] = {
+            "bm25_search": micro.bench_bm25(app_main.bm25_ret, queries, args.micro_n),
+            "dense_search": micro.bench_dense(app_main.vectorstore, queries, app_main.settings.TOP_K_VECTOR, args.micro_n),
+            "dense_quantized": micro.bench_quantized(app_main.vectorstore, queries, app_main.settings.TOP_K_VECTOR,
+                                                     args.micro_n, app_main.settings.DENSE_RESCORE_FACTOR),
+            "rerank": micro.bench_rerank(queries, cand_lists, app_main.settings.RERANK_TOPN, args.micro_n),
+            "catalog": micro.bench_catalog(app_main.COURSES, jd_objs, args.micro_n),
+            "pick_path": micro.bench_pick_path(courses, gap_maps, app_main.COURSES, args.candidates, args.micro_n),
+            "render_plan_pdf": micro.bench_pdf(jd_objs[0].role, [p.model_dump() for p in plan.plan],
+                                               plan.gap_map, plan.timeline.model_dump(), max(1, args.micro_n // 4)),
+        }
+
+        from bench.synth import random_profiles
+        bodies = random_profiles(jds, args.requests, args.distinct, seed=args.seed)
+        # server-side stage histograms should only reflect the load phase
+        metrics.reset()
+        out["load"] = run_load(server.url, bodies, args.concurrency)
+        snap = httpx.get(f"{server.url}/metrics", timeout=30).json()
+        out["server"] = {"routes": snap.get("routes", {}), "stages": snap.get("stages", {}),
+                         "plan_cache": snap.get("plan_cache", {})}
+    return out
+
+
+def main(argv: List[str] = None) -> None:
+    ap = argparse.ArgumentParser(prog="python -m bench.run")
+    ap.add_argument("--scales", default="100,10000", help="comma-separated course counts, e.g. 100,10000,1000000")
+    ap.add_argument("--jds", type=int, default=20)
+    ap.add_argument("--requests", type=int, default=500, help="HTTP requests per scale")
+    ap.add_argument("--concurrency", type=int, default=16)
+    ap.add_argument("--distinct", type=int, default=100, help="distinct profiles in the load mix")
+    ap.add_argument("--candidates", type=int, default=50, help="pick_path candidate pool size")
+    ap.add_argument("--micro-n", type=int, default=200, help="iterations per micro-benchmark")
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--out", default="", help="write JSON here (default: stdout)")
+    ap.add_argument("--single", action="store_true", help=argparse.SUPPRESS)
+    args = ap.parse_args(argv)
+    scales = [int(s) for s in args.scales.split(",") if s.strip()]
+
+    if args.single:
+        print(json.dumps(run_scale(scales[0], args)))
+        return
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "args": {k: v for k, v in vars(args).items() if k not in ("out", "single")},
+            "backends": {k: os.environ.get(k, v) for k, v in STUB_ENV.items()},
+        },
+        "results": {},
+    }
+    for n in scales:
+        cmd = [sys.executable, "-m", "bench.run", "--single", f"--scales={n}"]
+        for k, v in report["meta"]["args"].items():
+            if k != "scales":
+                cmd.append(f"--{k.replace('_', '-')}={v}")
+        proc = subprocess.run(cmd, capture_output=True, text=True)
+        if proc.returncode:
+            sys.stderr.write(proc.stderr)
+            raise SystemExit(f"scale {n} failed")
+        report["results"][str(n)] = json.loads(proc.stdout.strip().splitlines()[-1])
+
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# bench/synth.py
+"""Synthetic courses.jsonl / jds.jsonl in the app's schema, at any scale."""
+import argparse, json, os, random
+from typing import Dict, List
+
+LEVELS = "bia"
+DIFFICULTY = ["beginner", "intermediate", "advanced"]
+# real skills first so synthetic JDs overlap the shipped catalog's vocabulary
+BASE_SKILLS = [
+    "python", "pytest", "selenium", "playwright", "api", "http", "git", "ci", "docker", "oop",
+    "sql", "locators", "parallel", "reporting", "performance", "k6", "jmeter", "security_testing",
+    "owasp", "appium", "mobile", "graphql", "contract_testing", "pact", "observability", "fixtures",
+    "mocking", "test_design", "coverage", "linux", "shell", "kubernetes", "llm_eval", "rag",
+]
+WORDS = ["testing", "automation", "deep", "dive", "fundamentals", "advanced", "practical", "pipelines",
+         "frameworks", "patterns", "quality", "engineering", "for", "testers", "hands-on", "mastery"]
+
+
+def skill_vocab(n_courses: int) -> List[str]:
+    # vocabulary grows slowly with catalog size, like a real taxonomy
+    extra = max(0, int(n_courses ** 0.5) - len(BASE_SKILLS))
+    return BASE_SKILLS + [f"skill_{i}" for i in range(extra)]
+
+
+def make_course(i: int, vocab: List[str], rng: random.Random) -> Dict:
+    skills = rng.sample(vocab, rng.randint(1, 4))
+    words = rng.sample(WORDS, 3)
+    return {
+        "course_id": f"S{i:07d}",
+        "title": f"{skills[0].replace('_', ' ').title()} {' '.join(words)}",
+        "skills": [f"{s}:{rng.choice(LEVELS)}" for s in skills],
+        "difficulty": rng.choice(DIFFICULTY),
+        "duration_weeks": rng.randint(1, 6),
+        "prerequisites": [f"{rng.choice(vocab)}:b"] if rng.random() < 0.4 else [],
+        "outcomes": [f"{rng.choice(WORDS)} {s}" for s in skills],
+    }
+
+
+def make_jd(i: int, vocab: List[str], rng: random.Random) -> Dict:
+    skills = rng.sample(vocab[: max(12, len(vocab) // 4)], rng.randint(5, 9))
+    return {
+        "jd_id": f"JD_SYN_{i:04d}",
+        "role": f"Synthetic Role {i}",
+        "skills_required": {s: rng.randint(1, 3) for s in skills},
+    }
+
+
+def generate(out_dir: str, n_courses: int, n_jds: int = 20, seed: int = 7) -> Dict[str, str]:
+    """Write both files under out_dir; same arguments always give the same bytes."""
+    rng = random.Random(seed)
+    vocab = skill_vocab(n_courses)
+    os.makedirs(out_dir, exist_ok=True)
+    paths = {"courses": os.path.join(out_dir, "courses.jsonl"), "jds": os.path.join(out_dir, "jds.jsonl")}
+    with open(paths["courses"], "w") as f:
+        for i in range(n_courses):
+            f.write(json.dumps(make_course(i, vocab, rng)) + "\n")
+    with open(paths["jds"], "w") as f:
+        for i in range(n_jds):
+            f.write(json.dumps(make_jd(i, vocab, rng)) + "\n")
+    return paths
+
+
+def random_profiles(jds: List[Dict], n: int, distinct: int, seed: int = 11) -> List[Dict]:
+    """n /advise bodies drawn from `distinct` unique (role, skills) profiles."""
+    rng = random.Random(seed)
+    pool = []
+    for _ in range(max(1, distinct)):
+        jd = rng.choice(jds)
+        have = {s: rng.randint(0, lvl) for s, lvl in jd["skills_required"].items() if rng.random() < 0.5}
+        pool.append({"profile": {"skills": have, "years": rng.randint(0, 10), "goal_role": jd["role"]}})
+    return [rng.choice(pool) for _ in range(n)]
+
+
+def main(argv=None) -> None:
+    ap = argparse.ArgumentParser(prog="python -m bench.synth")
+    ap.add_argument("--courses", type=int, default=1000)
+    ap.add_argument("--jds", type=int, default=20)
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--out", required=True)
+    args = ap.parse_args(argv)
+    print(json.dumps(generate(args.out, args.courses, args.jds, args.seed)))
+
+
+if __name__ == "__main__":
+    main()